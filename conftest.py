@@ -0,0 +1,22 @@
+"""
+Shared pytest fixtures for the Chrome smoke tests.
+"""
+
+import pytest
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+
+@pytest.fixture(scope='session')
+def driver():
+    """One headless Chrome for the whole session, so each test pays only for its navigation."""
+    # Minimal Chrome options for Docker
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+
+    d = webdriver.Chrome(options=options)
+    yield d
+    d.quit()
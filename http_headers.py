@@ -0,0 +1,42 @@
+"""
+Header copying shared by the experiment runners.
+"""
+
+import os
+import sys
+from typing import Dict
+
+# Lower-cased header names left out of every runner's network logs (comma-separated DROP_HEADERS, e.g. "cookie,user-agent")
+DROPPED_HEADERS = frozenset(
+    name.strip().lower() for name in os.getenv('DROP_HEADERS', '').split(',') if name.strip()
+)
+
+# Headers whose values repeat across nearly every captured record (content types, CORS headers,
+# server tokens); only these values are interned. Per-response values (Date, Set-Cookie, ...) never repeat.
+_SHARED_VALUE_HEADERS = frozenset({
+    'accept', 'accept-encoding', 'accept-language', 'access-control-allow-credentials',
+    'access-control-allow-origin', 'cache-control', 'connection', 'content-encoding', 'content-type',
+    'origin', 'pragma', 'sec-fetch-dest', 'sec-fetch-mode', 'sec-fetch-site', 'server', 'user-agent', 'vary',
+})
+
+
+def copy_headers(headers, intern: bool = False) -> Dict[str, str]:
+    """
+    Copy a selenium-wire header object like dict(headers) (repeated names keep their first value),
+    leaving out DROPPED_HEADERS. One pass over items(): indexing an email.message.Message by name
+    is a linear scan. With intern=True, names and low-cardinality values share one string each,
+    for records that stay in memory until their iframe disappears.
+    """
+    copied = {}
+    for name, value in headers.items():
+        if name in copied:
+            continue
+        lower = name.lower()
+        if lower in DROPPED_HEADERS:
+            continue
+        if intern:
+            name = sys.intern(name)
+            if isinstance(value, str) and lower in _SHARED_VALUE_HEADERS:
+                value = sys.intern(value)
+        copied[name] = value
+    return copied
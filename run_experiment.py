@@ -4,24 +4,41 @@ Mellowtel SDK Network Analysis Tool
 Captures all network activity from Chrome browsing with extension installed.
 """
 
-import json
+import atexit
+import base64
+import functools
+import hashlib
+import io
 import logging
 import logging.handlers
+import multiprocessing
 import os
 import queue
 import random
+import re
+import shutil
+import struct
 import sys
+import tempfile
 import threading
 import time
-from datetime import datetime
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
 from urllib.parse import urlparse
 
+import orjson
+
 from seleniumwire import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import WebDriverException, TimeoutException
 
+from http_headers import copy_headers
+
 
 VERBOSE = '--verbose' in sys.argv
 
@@ -65,8 +82,173 @@ if VERBOSE:
 queue_listener = logging.handlers.QueueListener(log_queue, *_queue_handlers, respect_handler_level=True)
 queue_listener.start()
 
+# Startup banner logged as one record by run_experiment(); fields are NetworkAnalyzer attributes
+_BANNER = """{rule}
+Mellowtel SDK Network Analysis Tool - Targeted Capture Mode
+{rule}
+Configuration:
+  - Iframe detection polling: every {iframe_poll_interval} seconds (backing off to {iframe_poll_max}s while no iframe is visible)
+  - Max wait for iframe: {max_wait_for_iframe} seconds
+  - Fallback dwell time: {dwell_time} seconds (if no iframe detected)
+  - Dwell quiet period: {dwell_quiet_period} seconds (0 = always wait full dwell)
+  - Quiescence timeout: {quiescence_timeout} seconds (0 = always monitor full window)
+  - Headless mode: {headless}
+  - Disable images: {disable_images}
+  - Capture headers: {capture_headers}
+  - Parallel sites: {parallel_sites}
+  - Output directory: {run_dir}/
+    - Network logs: network_logs.jsonl
+    - Iframe metadata: iframe_metadata.jsonl
+    - POST payloads: post_payloads/
+
+Filtering & Aggregation:
+  - Only capturing requests to 'request.mellow.tel'
+  - Only capturing requests with same domain as Mellowtel iframes
+  - Detecting iframes with 'mllwtl' in id/data-id attributes
+  - Tracking iframe presence duration
+  - Categorizing requests by iframe/domain in real-time
+  - Writing to file when iframe disappears from DOM
+  - Saving POST payloads to request.mellow.tel with text content-type
+{rule}""".replace('{rule}', '=' * 70)
+
 INTERESTING_URL_PATTERNS = ('speed.cloudflare', 'aim.cloudflare', 'mellowtel', 'mellow.tel', 'mllwtl')
 
+# Installs window.__mllwtlScan() in the top-level document. A MutationObserver marks the document
+# dirty when an iframe is added, removed or has its id/data-id/src changed; a clean scan returns
+# null so the caller reuses its previous result. The live HTMLCollection is cached, and iframes
+# already rejected with the same id/data-id are skipped. window.__mllwtlWaitForChange(ms) resolves
+# on the next such change (or after ms). Registered via Page.addScriptToEvaluateOnNewDocument so
+# every navigation gets it before page scripts run; the scripts below install it on demand otherwise.
+IFRAME_PROBE_INSTALL_JS = """
+if (window === window.top && !window.__mllwtlScan) {
+    let dirty = true;
+    let iframes = null;
+    let waiters = [];
+    const rejected = new WeakMap();
+
+    const touchesIframe = function (nodes) {
+        for (const node of nodes) {
+            if (node.nodeName === 'IFRAME' || (node.nodeType === 1 && node.getElementsByTagName('iframe').length)) {
+                return true;
+            }
+        }
+        return false;
+    };
+
+    new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            const relevant = mutation.type === 'attributes'
+                ? mutation.target.nodeName === 'IFRAME'
+                : touchesIframe(mutation.addedNodes) || touchesIframe(mutation.removedNodes);
+            if (relevant) {
+                dirty = true;
+                waiters.forEach(resolve => resolve());
+                waiters = [];
+                return;
+            }
+        }
+    }).observe(document, {
+        childList: true, subtree: true,
+        attributes: true, attributeFilter: ['id', 'data-id', 'src']
+    });
+
+    window.__mllwtlWaitForChange = function (timeoutMs) {
+        return new Promise(resolve => {
+            if (dirty) {
+                resolve();
+                return;
+            }
+            waiters.push(resolve);
+            setTimeout(resolve, timeoutMs);
+        });
+    };
+
+    window.__mllwtlScan = function () {
+        if (!dirty) {
+            return null;
+        }
+        dirty = false;
+
+        iframes = iframes || document.getElementsByTagName('iframe');
+        const mellowtelIframes = [];
+
+        for (let i = 0; i < iframes.length; i++) {
+            const iframe = iframes[i];
+            const id = iframe.getAttribute('id') || '';
+            const dataId = iframe.getAttribute('data-id') || '';
+            const key = id + '|' + dataId;
+            if (rejected.get(iframe) === key) {
+                continue;
+            }
+
+            if (id.includes('mllwtl') || dataId.includes('mllwtl')) {
+                const src = iframe.getAttribute('src') || '';
+                if (src) {
+                    // Extract all attributes
+                    const allAttributes = {};
+                    for (let attr of iframe.attributes) {
+                        allAttributes[attr.name] = attr.value;
+                    }
+
+                    mellowtelIframes.push({
+                        src: src,
+                        id: id,
+                        dataId: dataId,
+                        allAttributes: allAttributes
+                    });
+                }
+            } else {
+                rejected.set(iframe, key);
+            }
+        }
+
+        return mellowtelIframes;
+    };
+}
+"""
+
+IFRAME_PROBE_JS = IFRAME_PROBE_INSTALL_JS + """
+return window.__mllwtlScan();
+"""
+
+# Async variant: blocks in the page until an iframe change or arguments[0] ms pass, then scans
+IFRAME_WAIT_JS = IFRAME_PROBE_INSTALL_JS + """
+const done = arguments[arguments.length - 1];
+window.__mllwtlWaitForChange(arguments[0]).then(() => done(window.__mllwtlScan()));
+"""
+
+# Hot-path stubs: the probe is normally already installed, so the poll loop only ships (and Chrome
+# only parses) these one-liners. They answer IFRAME_PROBE_MISSING when the full source is needed.
+IFRAME_PROBE_MISSING = '__mllwtl_probe_missing__'
+
+IFRAME_PROBE_CALL_JS = (
+    "return window.__mllwtlScan ? window.__mllwtlScan() : '%s';" % IFRAME_PROBE_MISSING
+)
+
+IFRAME_WAIT_CALL_JS = (
+    "const done = arguments[arguments.length - 1];"
+    " if (!window.__mllwtlWaitForChange) { done('%s'); return; }"
+    " window.__mllwtlWaitForChange(arguments[0]).then(() => done(window.__mllwtlScan()));" % IFRAME_PROBE_MISSING
+)
+
+# Passed as a single --disable-features switch (Chrome only honours the last one given)
+CHROME_DISABLED_FEATURES = (
+    'Translate',
+    'MediaRouter',
+    'OptimizationHints',
+    'InterestFeedContentSuggestions',
+    'CalculateNativeWinOcclusion',
+)
+
+# Ad/analytics hosts that never carry Mellowtel traffic; Chrome connects to them without the proxy
+PROXY_EXCLUDED_HOSTS = (
+    '*.google-analytics.com',
+    '*.googletagmanager.com',
+    '*.doubleclick.net',
+    '*.googlesyndication.com',
+    '*.googleadservices.com',
+)
+
 
 def _is_interesting_url(url: str) -> bool:
     return any(p in url for p in INTERESTING_URL_PATTERNS)
@@ -138,11 +320,214 @@ class WebSocketCaptureAddon:
             logger.warning(f"[WEBSOCKET END] Error: {e}")
 
 
+def _auto_parallel_sites() -> int:
+    """
+    Chrome instances to run for PARALLEL_SITES=auto: one per CPU, capped so each gets ~1 GiB of RAM.
+    Site visits mostly wait on the network and the monitoring window, so CPUs are rarely the limit.
+    """
+    workers = os.cpu_count() or 1
+    try:
+        memory_bytes = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        workers = min(workers, memory_bytes // (1 << 30))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return max(1, workers)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_sites(path: str) -> Tuple[str, ...]:
+    """Non-empty, non-comment lines of a sites file, memoized so retries and restarts skip the re-read."""
+    # One read + splitlines, and each line stripped once
+    with open(path, 'r') as f:
+        return tuple(line for line in map(str.strip, f.read().splitlines()) if line and not line.startswith('#'))
+
+
+@functools.lru_cache(maxsize=16384)
+def _netloc(url: str) -> str:
+    """Lower-cased netloc of url, memoized: iframe srcs, Referers and request hosts repeat constantly."""
+    return urlparse(url).netloc.lower()
+
+
+def _read_varint(data: bytes, pos: int):
+    """Decode a protobuf varint at pos; returns (value, next position)."""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _protobuf_fields(data: bytes):
+    """Yield (field number, value) for the varint and length-delimited fields of a protobuf message."""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+
+def _parse_crx(crx: bytes):
+    """
+    Split a CRX file into (16-byte extension ID, signing public key, offset of the zip archive).
+    CRX3 carries the ID as crx_id in its signed header data; CRX2 derives it from the SHA-256 of
+    the public key. Returns None for anything else.
+    """
+    try:
+        if crx[:4] != b'Cr24':
+            return None
+        version, = struct.unpack_from('<I', crx, 4)
+        if version == 3:
+            header_size, = struct.unpack_from('<I', crx, 8)
+            fields = list(_protobuf_fields(crx[12:12 + header_size]))
+            # CrxFileHeader.signed_header_data (field 10000) -> SignedData.crx_id (field 1)
+            signed_data = next(value for field, value in fields if field == 10000)
+            id_bytes = next(value for field, value in _protobuf_fields(signed_data) if field == 1)
+            if len(id_bytes) != 16:
+                return None
+            # The key proofs (sha256_with_rsa = 2, sha256_with_ecdsa = 3) hold public_key as field 1;
+            # the one whose hash prefix is the ID is the extension's own key
+            public_key = None
+            for field, proof in fields:
+                if field in (2, 3):
+                    key = next((value for key_field, value in _protobuf_fields(proof) if key_field == 1), None)
+                    if key and hashlib.sha256(key).digest()[:16] == id_bytes:
+                        public_key = key
+                        break
+            return id_bytes, public_key, 12 + header_size
+        if version == 2:
+            key_length, signature_length = struct.unpack_from('<II', crx, 8)
+            public_key = crx[16:16 + key_length]
+            return hashlib.sha256(public_key).digest()[:16], public_key, 16 + key_length + signature_length
+    except (struct.error, StopIteration, IndexError, ValueError):
+        pass
+    return None
+
+
+def _crx_extension_id(crx: bytes) -> Optional[str]:
+    """
+    Chrome's ID for a packed extension, read from the CRX header (no browser round-trip needed).
+    Each nibble of the ID bytes is written as a letter a-p.
+    """
+    parsed = _parse_crx(crx)
+    if parsed is None:
+        return None
+    return ''.join(chr(ord('a') + int(nibble, 16)) for nibble in parsed[0].hex())
+
+
+def _unpack_crx(crx: bytes, name: str) -> Optional[str]:
+    """
+    Extract a CRX once into a content-addressed directory under the temp dir and return its path.
+    Every Chrome loading it (parallel shards, driver restarts, later runs) shares the same copy.
+    Like ChromeDriver, the CRX public key is written into the manifest so the unpacked extension
+    keeps its packed ID. Returns None if the CRX cannot be unpacked.
+    """
+    parsed = _parse_crx(crx)
+    if parsed is None or parsed[1] is None:
+        return None
+    _, public_key, zip_offset = parsed
+
+    target = Path(tempfile.gettempdir()) / 'mellowtel_extensions' / f'{Path(name).stem}_{hashlib.sha256(crx).hexdigest()[:16]}'
+    if (target / 'manifest.json').exists():
+        return str(target)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=target.parent)
+    try:
+        with zipfile.ZipFile(io.BytesIO(crx[zip_offset:])) as archive:
+            archive.extractall(staging)
+        manifest_path = Path(staging) / 'manifest.json'
+        manifest = orjson.loads(manifest_path.read_bytes())
+        manifest['key'] = base64.b64encode(public_key).decode('ascii')
+        manifest_path.write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+        os.rename(staging, target)
+    except Exception as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        # Another process may have finished the same extraction first; its copy is identical
+        if (target / 'manifest.json').exists():
+            return str(target)
+        logger.warning(f"Could not unpack {name}: {e}")
+        return None
+    return str(target)
+
+
+def _encode_headers(obj):
+    """
+    orjson default hook: serialize selenium-wire header objects as plain name -> value objects
+    (see http_headers.copy_headers, which also leaves out DROP_HEADERS).
+    """
+    if hasattr(obj, 'items'):
+        return copy_headers(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _format_post_payload(now: datetime, site_url: str, url: str, content_type: str, body) -> bytes:
+    """Render a captured POST payload file: a metadata header followed by the decoded body."""
+    header = (
+        f"POST Payload Capture\n"
+        + "=" * 70 + "\n"
+        + f"Timestamp: {now.replace(tzinfo=None).isoformat()}\n"
+        + f"Visited Site: {site_url}\n"
+        + f"URL: {url}\n"
+        + f"Content-Type: {content_type}\n"
+        + f"Content-Length: {len(body) if body else 0} bytes\n"
+        + "=" * 70 + "\n\n"
+    ).encode('utf-8')
+
+    if not isinstance(body, bytes):
+        return header + str(body).encode('utf-8')
+
+    # UTF-8 bodies (the usual case) are written through as-is: decoding and re-encoding them would
+    # produce the same bytes. isascii() answers without allocating; otherwise validate by decoding.
+    if body.isascii():
+        return header + body
+    try:
+        body.decode('utf-8')
+        return header + body
+    except UnicodeDecodeError:
+        pass
+
+    # If UTF-8 fails, fall back to latin-1 (which accepts any byte sequence)
+    try:
+        body_text = body.decode('latin-1')
+    except:
+        # Save as hex if decoding fails
+        body_text = f"[Binary data, hex dump]:\n{body.hex()}"
+    return header + body_text.encode('utf-8')
+
+
+@dataclass(slots=True)
+class RequestRecord:
+    """A captured Mellowtel request; serialized as one line of network_logs.jsonl."""
+    timestamp: int
+    url: str
+    method: str
+    request_headers: Any  # selenium-wire header object (or {}); serialized via _encode_headers
+    response: Optional[Dict[str, Any]]
+    visited_site: Optional[str] = None
+    iframe_src: Optional[str] = None
+    iframe_domain: Optional[str] = None
+
+
 class FileWriterQueue:
     """Thread-safe queue for async file writes to prevent I/O blocking."""
 
+    # Append-mode files stay open for the whole run behind a large userspace buffer
+    APPEND_BUFFER_SIZE = 1 << 20
+    _FLUSH = object()
+
     def __init__(self):
         self.write_queue = queue.Queue()
+        self._handles = {}  # (filepath, mode) -> open file, owned by the worker thread
         self.worker_thread = threading.Thread(target=self._worker, daemon=False)
         self.shutdown_event = threading.Event()
         self.worker_thread.start()
@@ -154,14 +539,34 @@ class FileWriterQueue:
             try:
                 task = self.write_queue.get(timeout=0.1)
                 if task is None:  # Shutdown signal
+                    self.write_queue.task_done()
                     break
 
+                if task is self._FLUSH:
+                    try:
+                        for f in self._handles.values():
+                            f.flush()
+                    except Exception as e:
+                        logger.error(f"Failed to flush output files: {e}")
+                    finally:
+                        self.write_queue.task_done()
+                    continue
+
                 # Execute the write task
                 filepath, content, mode = task
                 try:
-                    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-                    with open(filepath, mode) as f:
-                        f.write(content)
+                    if callable(content):
+                        # Deferred content (e.g. POST payload decoding) is rendered here, off the monitoring thread
+                        content = content()
+                    elif isinstance(content, list):
+                        # Records queued by enqueue_jsonl are serialized here, off the monitoring thread
+                        content = b'\n'.join(orjson.dumps(record, default=_encode_headers) for record in content) + b'\n'
+                    if mode.startswith('a'):
+                        self._get_handle(filepath, mode).write(content)
+                    else:
+                        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+                        with open(filepath, mode) as f:
+                            f.write(content)
                 except Exception as e:
                     logger.error(f"Failed to write to {filepath}: {e}")
                 finally:
@@ -172,10 +577,45 @@ class FileWriterQueue:
             except Exception as e:
                 logger.error(f"Error in FileWriterQueue worker: {e}")
 
-    def enqueue_write(self, filepath: str, content: str, mode: str = 'a'):
+        self._close_handles()
+
+    def _get_handle(self, filepath: str, mode: str):
+        """Return the cached append handle for filepath, opening it on first use."""
+        key = (filepath, mode)
+        f = self._handles.get(key)
+        if f is None:
+            Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+            f = open(filepath, mode, buffering=self.APPEND_BUFFER_SIZE)
+            self._handles[key] = f
+        return f
+
+    def _close_handles(self):
+        """Flush, fsync and close every cached append handle (the only fsync of the run)."""
+        for (filepath, _), f in self._handles.items():
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            except Exception as e:
+                logger.error(f"Failed to close {filepath}: {e}")
+        self._handles.clear()
+
+    def enqueue_write(self, filepath: str, content: Union[str, bytes, Callable[[], Union[str, bytes]]], mode: str = 'a'):
         """Enqueue a file write operation."""
         self.write_queue.put((filepath, content, mode))
 
+    def enqueue_jsonl(self, filepath: str, records: List[Any]):
+        """Enqueue records to be serialized with orjson and appended as JSON Lines by the worker."""
+        if records:
+            self.write_queue.put((filepath, records, 'ab'))
+
+    def flush(self):
+        """
+        Enqueue a flush of all open append handles (bounds data loss if the process crashes).
+        This only hands data to the kernel; durability comes from the single fsync at shutdown.
+        """
+        self.write_queue.put(self._FLUSH)
+
     def shutdown(self, timeout: float = 30.0):
         """Shutdown the worker thread and wait for queue to drain."""
         logger.info(f"Shutting down FileWriterQueue (queue size: {self.write_queue.qsize()})...")
@@ -204,35 +644,54 @@ class FileWriterQueue:
 class NetworkAnalyzer:
     """Main class for running the network analysis experiment."""
 
-    def __init__(self):
+    def __init__(self, extension_name: Optional[str] = None, timestamp: Optional[str] = None,
+                 shard_id: Optional[int] = None):
         # Initialize async file writer queue
         self.file_writer = FileWriterQueue()
         self.verbose = VERBOSE
 
         self.dwell_time = int(os.getenv('DWELL_TIME', '30'))
+        self.dwell_quiet_period = int(os.getenv('DWELL_QUIET_PERIOD', '6'))  # End fallback dwell after this many quiet seconds (0 = full dwell)
+        self.quiescence_timeout = int(os.getenv('QUIESCENCE_TIMEOUT', '0'))  # End monitoring after this many seconds without Mellowtel activity (0 = full window)
+        self.last_mellowtel_activity = 0.0  # time.monotonic() of the last iframe detection or Mellowtel request
         self.iframe_poll_interval = 2  # Check for iframe every 2 seconds
+        self.iframe_poll_max = 10  # While no Mellowtel iframe is visible, polls back off up to this interval
         self.max_wait_for_iframe = 300  # Maximum 5 minutes to wait for iframe to appear
         self.headless = os.getenv('HEADLESS', 'false').lower() == 'true'
         self.disable_images = os.getenv('DISABLE_IMAGES', 'false').lower() == 'true'
+        self.capture_headers = os.getenv('CAPTURE_HEADERS', 'true').lower() == 'true'
+        self.chrome_profile_dir = os.getenv('CHROME_PROFILE_DIR', '')  # Persistent profile root; empty = fresh temporary profile
+        self.debug_chrome = os.getenv('DEBUG_CHROME', '0') == '1'
+        parallel_sites = os.getenv('PARALLEL_SITES', '1').strip().lower()
+        # Chrome instances visiting sites concurrently ('auto' sizes the pool from CPUs and RAM)
+        self.parallel_sites = _auto_parallel_sites() if parallel_sites == 'auto' else max(1, int(parallel_sites))
+        self.shard_id = shard_id  # Set in worker processes when sites are split across PARALLEL_SITES
         self.sites_file = 'sites.txt'
 
-        # Randomly select extension from available options
+        # Randomly select extension from available options (worker processes reuse the parent's choice)
         available_extensions = ['IdleForest.crx', 'SupportWithMellowtel.crx']
-        self.extension_name = random.choice(available_extensions)
+        self.extension_name = extension_name or random.choice(available_extensions)
         self.extension_path = os.path.join('crx_files', self.extension_name)
+        self._crx = None  # Raw extension file, read once and reused on driver reinitialization
+        self._unpacked_extension_dir = None  # Shared unpacked copy of the CRX (None = hand the CRX to ChromeDriver)
         logger.info(f"Selected extension: {self.extension_name}")
 
-        # Generate timestamped output directory
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        # Generate timestamped output directory (worker processes write JSONL to their own shard directory)
+        timestamp = timestamp or datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
         self.timestamp = timestamp
         self.run_dir = f'output/run_{timestamp}'
-        self.output_file = f'{self.run_dir}/network_logs.jsonl'
-        self.iframe_metadata_file = f'{self.run_dir}/iframe_metadata.jsonl'
+        self.output_dir = self.run_dir if shard_id is None else f'{self.run_dir}/shard_{shard_id}'
+        self.output_file = f'{self.output_dir}/network_logs.jsonl'
+        self.iframe_metadata_file = f'{self.output_dir}/iframe_metadata.jsonl'
         self.post_payloads_dir = f'{self.run_dir}/post_payloads'
 
         self.driver = None
+        self._temp_profile_dir = None  # Temporary Chrome profile of the current driver (None for CHROME_PROFILE_DIR)
         self.mellowtel_iframe_urls = set()  # Track iframe URLs for filtering
         self.mellowtel_domains = set()  # Track iframe domains for filtering
+        self.iframe_domains = {}  # iframe URL -> domain, parsed once when the iframe is first seen
+        self._mellowtel_pattern = None  # Compiled domain filter, rebuilt when domains change
+        self._match_cache = {}  # request URL -> is_mellowtel_request() result for the current pattern
         self.iframe_metadata = {}  # Track iframe metadata: {src: {first_seen, last_seen, id, data_id, domain}}
         self.extension_id = None  # Store extension ID for activation
         self.extension_activated = False  # Track if extension has been activated
@@ -240,9 +699,10 @@ class NetworkAnalyzer:
         self.post_payload_counter = 0  # Counter for POST payload files
 
         # Track requests per iframe/domain for aggregated writing
-        self.iframe_requests = {}  # {iframe_src: {'domain': str, 'requests': [request_data]}}
+        self.iframe_requests = {}  # {iframe_src: {'domain': str, 'requests': [RequestRecord]}}
         self.current_visible_iframes = set()  # Currently visible iframe URLs
-        self.last_processed_request_index = 0  # Track which requests we've already processed
+        self._last_iframe_scan = []  # Last iframe scan result, reused while the DOM is unchanged
+        self._captured_requests = queue.SimpleQueue()  # Filled by the response interceptor on proxy threads
 
 
     def setup_chrome_options(self) -> Options:
@@ -265,15 +725,28 @@ class NetworkAnalyzer:
         else:
             logger.info("Using Xvfb virtual display (User-Agent will show normal 'Chrome')")
 
-        # Remote debugging (helps with stability)
-        chrome_options.add_argument('--remote-debugging-port=9222')
-
         # Window size
         chrome_options.add_argument('--window-size=1920,1080')
 
-        # Set unique user data directory to avoid conflicts
-        import tempfile
-        user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
+        if self.chrome_profile_dir:
+            # Persistent profile: extension storage/config survives across runs, so the extension starts warm.
+            # One profile per extension (and per shard, since Chrome locks a profile to one process)
+            profile_name = self.extension_name if self.shard_id is None else f'{self.extension_name}_shard_{self.shard_id}'
+            user_data_dir = str(Path(self.chrome_profile_dir) / profile_name)
+            Path(user_data_dir).mkdir(parents=True, exist_ok=True)
+            # A previous run killed mid-session leaves Chrome's singleton lock behind
+            for lock_name in ('SingletonLock', 'SingletonSocket', 'SingletonCookie'):
+                lock_path = Path(user_data_dir) / lock_name
+                lock_path.unlink(missing_ok=True)  # Also removes dangling symlinks, which exists() misses
+            chrome_options.add_argument('--profile-directory=Default')
+        else:
+            # Set unique user data directory to avoid conflicts
+            # Placed on tmpfs (/dev/shm, sized via shm_size in docker-compose.yml)
+            profile_parent = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None
+            user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_', dir=profile_parent)
+            # Removed as soon as its Chrome quits (tmpfs is RAM); atexit only covers a crashed run
+            self._temp_profile_dir = user_data_dir
+            atexit.register(shutil.rmtree, user_data_dir, ignore_errors=True)
         chrome_options.add_argument(f'--user-data-dir={user_data_dir}')
         logger.info(f"Using user data directory: {user_data_dir}")
 
@@ -289,11 +762,15 @@ class NetworkAnalyzer:
         chrome_options.add_argument('--disable-notifications')
         chrome_options.add_argument('--disable-popup-blocking')
 
-        # Optional: Disable images for faster loading
-        prefs = {}
+        # Browser features that only add background work during a measurement run
+        chrome_options.add_argument(f'--disable-features={",".join(CHROME_DISABLED_FEATURES)}')
+
+        # Optional: Disable images for faster loading (blink setting applies from renderer start,
+        # unlike the content-settings pref which only takes effect once the profile is loaded)
         if self.disable_images:
-            prefs["profile.managed_default_content_settings.images"] = 2
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
 
+        prefs = {}
         # Disable save password prompts
         prefs["credentials_enable_service"] = False
         prefs["profile.password_manager_enabled"] = False
@@ -304,7 +781,15 @@ class NetworkAnalyzer:
         # Load extension if it exists
         if os.path.exists(self.extension_path):
             try:
-                chrome_options.add_extension(self.extension_path)
+                if self._crx is None:
+                    with open(self.extension_path, 'rb') as f:
+                        self._crx = f.read()
+                    self._unpacked_extension_dir = _unpack_crx(self._crx, self.extension_name)
+                if self._unpacked_extension_dir:
+                    # ChromeDriver would otherwise re-encode, transfer and re-extract the CRX on every start
+                    chrome_options.add_argument(f'--load-extension={self._unpacked_extension_dir}')
+                else:
+                    chrome_options.add_encoded_extension(base64.b64encode(self._crx).decode('ascii'))
                 logger.info(f"Extension loaded from: {self.extension_path}")
             except Exception as e:
                 logger.warning(f"Failed to load extension: {e}")
@@ -313,17 +798,23 @@ class NetworkAnalyzer:
             logger.warning(f"Extension file not found: {self.extension_path}")
             logger.warning("Continuing without extension. Network capture will only include page requests.")
 
-        # Logging for debugging
-        chrome_options.add_argument('--enable-logging')
-        chrome_options.add_argument('--v=1')
+        # Verbose Chrome logging and a fixed DevTools port only when debugging Chrome itself
+        # (parallel shards each get their own port so their Chromes do not collide on 9222)
+        if self.debug_chrome:
+            chrome_options.add_argument(f'--remote-debugging-port={9222 + (self.shard_id or 0)}')
+            chrome_options.add_argument('--enable-logging')
+            chrome_options.add_argument('--v=1')
+        else:
+            # Chrome still prints ERROR-level lines to stderr by default; keep only fatal ones
+            chrome_options.add_argument('--log-level=3')
 
         return chrome_options
 
     def load_sites(self) -> List[str]:
         """Load list of URLs from sites.txt and randomize their order."""
         try:
-            with open(self.sites_file, 'r') as f:
-                sites = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            # Copy the cached tuple: the order is shuffled below
+            sites = list(_load_sites(self.sites_file))
             logger.info(f"Loaded {len(sites)} sites from {self.sites_file}")
 
             # Randomize the order of sites
@@ -351,10 +842,17 @@ class NetworkAnalyzer:
         chrome_options = self.setup_chrome_options()
 
         # Selenium-wire options for network interception with full logging
+        # Keep-alive reuses upstream sockets through the proxy; noise hosts bypass the proxy entirely
         seleniumwire_options = {
             'disable_encoding': True,
-            'request_storage_base_dir': '/tmp/seleniumwire',
+            # In-memory storage avoids a disk write per captured request; the cap bounds RSS on busy
+            # pages (oldest evicted first). Processing reads the interceptor stream, not this storage.
+            'request_storage': 'memory',
+            'request_storage_max_size': 1000,
             'enable_har': True,
+            'connection_keep_alive': True,
+            'suppress_connection_errors': True,
+            'exclude_hosts': list(PROXY_EXCLUDED_HOSTS),
         }
 
         # Add WebSocket capture addon in verbose mode
@@ -374,6 +872,18 @@ class NetworkAnalyzer:
                 seleniumwire_options=seleniumwire_options
             )
             self.driver.set_page_load_timeout(60)
+            self._register_iframe_probe()
+
+            # Stream each captured request to the monitoring loop as its response arrives, instead of
+            # re-listing selenium-wire's storage every poll. Capture is deliberately not scoped: an iframe's
+            # document and first subresources load before the poll that detects it, and are only matched
+            # (in is_mellowtel_request) once its domain is tracked.
+            captured_requests = self._captured_requests
+
+            def capture_response(request, response):
+                captured_requests.put(request)
+
+            self.driver.response_interceptor = capture_response
 
             if self.verbose:
                 def request_interceptor(request):
@@ -387,6 +897,7 @@ class NetworkAnalyzer:
                     #     logger.info(f"[NETWORK REQUEST] {request.method} {url}")
 
                 def response_interceptor(request, response):
+                    capture_response(request, response)
                     url = request.url
                     if _is_interesting_url(url):
                         logger.info(f"[NETWORK RESPONSE][MATCH] {response.status_code} {url}")
@@ -411,6 +922,20 @@ class NetworkAnalyzer:
             logger.debug("  5. Check Docker shared memory (shm_size in docker-compose.yml)")
             sys.exit(1)
 
+    def _register_iframe_probe(self):
+        """Install the iframe probe into every new document of the tab before page scripts run."""
+        try:
+            self.driver.execute_cdp_cmd('Page.enable', {})
+            self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': IFRAME_PROBE_INSTALL_JS})
+        except Exception as e:
+            logger.warning(f"Could not register iframe probe script: {e}")
+
+    def _remove_temp_profile(self):
+        """Delete the temporary profile of a Chrome that has quit, freeing its space on /dev/shm."""
+        if self._temp_profile_dir:
+            shutil.rmtree(self._temp_profile_dir, ignore_errors=True)
+            self._temp_profile_dir = None
+
     def reinitialize_driver(self, reactivate_extension: bool = False) -> bool:
         """
         Reinitialize the Chrome driver after a timeout or crash.
@@ -428,17 +953,20 @@ class NetworkAnalyzer:
                     logger.warning(f"Error closing driver: {e}")
 
             self.driver = None
+            self._remove_temp_profile()
 
             self.initialize_driver()
 
             # Get extension ID
             self.get_extension_id()
 
+            # A new Chrome session starts with an inactive extension
+            self.extension_activated = False
+
             # Optionally reactivate extension if it was previously activated
             if reactivate_extension:
                 logger.info("Reactivating extension after reinitialization...")
                 self.activate_extension()
-                self.extension_activated = True
 
             logger.info("[SUCCESS]Driver reinitialized successfully")
             return True
@@ -457,12 +985,19 @@ class NetworkAnalyzer:
         try:
             logger.info("Getting extension ID...")
 
+            # Fast path: the ID is in the CRX header; a running extension target confirms it is installed
+            # and enabled, so chrome://extensions does not need to be opened at all
+            extension_id = self._extension_id_from_targets()
+            if extension_id:
+                self.extension_id = extension_id
+                logger.info(f"[SUCCESS]Found extension ID from CRX header: {self.extension_id}")
+                return self.extension_id
+
             # Navigate to chrome://extensions
             max_retries = 3
             for ext_attempt in range(max_retries):
                 try:
                     self.driver.get("chrome://extensions/")
-                    time.sleep(5)
                     break
                 except TimeoutException as e:
                     logger.error(f"Timeout navigating to extensions page (attempt {ext_attempt + 1}/{max_retries}): {e}")
@@ -484,34 +1019,43 @@ class NetworkAnalyzer:
                     else:
                         raise
 
-            # Enable developer mode to see extension IDs
+            # Enable developer mode and list all extensions in one round-trip; returns null until the
+            # page has rendered its items, so it is polled instead of sleeping a fixed time
             script = """
-            const devModeToggle = document.querySelector('extensions-manager')
-                .shadowRoot.querySelector('extensions-toolbar')
-                .shadowRoot.querySelector('#devMode');
+            const manager = document.querySelector('extensions-manager');
+            if (!manager || !manager.shadowRoot) {
+                return null;
+            }
+
+            const toolbar = manager.shadowRoot.querySelector('extensions-toolbar');
+            const devModeToggle = toolbar && toolbar.shadowRoot && toolbar.shadowRoot.querySelector('#devMode');
             if (devModeToggle && !devModeToggle.checked) {
                 devModeToggle.click();
             }
-            """
-            self.driver.execute_script(script)
-            time.sleep(2)
 
-            # Get all extension IDs and find IdleForest
-            script = """
-            const manager = document.querySelector('extensions-manager');
             const itemList = manager.shadowRoot.querySelector('extensions-item-list');
+            if (!itemList || !itemList.shadowRoot) {
+                return null;
+            }
             const items = itemList.shadowRoot.querySelectorAll('extensions-item');
 
             const extensions = [];
-            items.forEach(item => {
-                const name = item.shadowRoot.querySelector('#name').textContent.trim();
-                const id = item.id;
-                extensions.push({name: name, id: id});
-            });
+            for (const item of items) {
+                const nameElement = item.shadowRoot && item.shadowRoot.querySelector('#name');
+                if (!nameElement) {
+                    return null;
+                }
+                extensions.push({name: nameElement.textContent.trim(), id: item.id});
+            }
 
-            return extensions;
+            return extensions.length ? extensions : null;
             """
-            extensions = self.driver.execute_script(script)
+            try:
+                extensions = WebDriverWait(self.driver, 10, poll_frequency=0.2).until(
+                    lambda driver: driver.execute_script(script)
+                )
+            except TimeoutException:
+                extensions = []
             for ext in extensions:
                 logger.info(f"Found extension: {ext['name']} (ID: {ext['id']})")
                 # Look for IdleForest or Idle Forest
@@ -541,6 +1085,29 @@ class NetworkAnalyzer:
             logger.warning(f"Error getting extension ID: {e}")
             return None
 
+    def _extension_id_from_targets(self, timeout: float = 5) -> Optional[str]:
+        """
+        Return the loaded CRX's extension ID once Chrome lists a target (service worker, background
+        page) under chrome-extension://<id>/, or None if the ID is unknown or no target appears in time.
+        """
+        if self._crx is None:
+            return None
+        extension_id = _crx_extension_id(self._crx)
+        if not extension_id:
+            return None
+
+        prefix = f'chrome-extension://{extension_id}/'
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.2).until(
+                lambda driver: any(
+                    target['url'].startswith(prefix)
+                    for target in driver.execute_cdp_cmd('Target.getTargets', {})['targetInfos']
+                )
+            )
+        except (TimeoutException, WebDriverException, KeyError):
+            return None
+        return extension_id
+
     def enable_extension(self, extension_id: str):
         """
         Enable the extension via the toggle on chrome://extensions page.
@@ -554,7 +1121,6 @@ class NetworkAnalyzer:
                 for enable_attempt in range(max_retries):
                     try:
                         self.driver.get("chrome://extensions/")
-                        time.sleep(2)
                         break
                     except TimeoutException as e:
                         logger.error(f"Timeout navigating to extensions for enabling (attempt {enable_attempt + 1}/{max_retries}): {e}")
@@ -576,35 +1142,39 @@ class NetworkAnalyzer:
                         else:
                             raise
 
-            # Check and enable the extension toggle
+            # Check and enable the extension toggle; returns null until the extension's toggle has rendered
             script = f"""
             const manager = document.querySelector('extensions-manager');
-            const itemList = manager.shadowRoot.querySelector('extensions-item-list');
-            const items = itemList.shadowRoot.querySelectorAll('extensions-item');
-
-            let found = false;
-            items.forEach(item => {{
-                if (item.id === '{extension_id}') {{
-                    const toggle = item.shadowRoot.querySelector('#enableToggle');
-                    if (toggle && !toggle.checked) {{
-                        toggle.click();
-                        found = true;
-                        return 'enabled';
-                    }} else if (toggle && toggle.checked) {{
-                        found = true;
-                        return 'already_enabled';
-                    }}
-                }}
-            }});
-
-            return found ? 'success' : 'not_found';
+            const itemList = manager && manager.shadowRoot && manager.shadowRoot.querySelector('extensions-item-list');
+            const item = itemList && itemList.shadowRoot && itemList.shadowRoot.getElementById('{extension_id}');
+            const toggle = item && item.shadowRoot && item.shadowRoot.querySelector('#enableToggle');
+            if (!toggle) {{
+                return null;
+            }}
+            if (toggle.checked) {{
+                return 'already_enabled';
+            }}
+            toggle.click();
+            return 'success';
             """
 
-            result = self.driver.execute_script(script)
+            # Poll for the shadow-DOM list instead of sleeping a fixed time after navigation
+            try:
+                result = WebDriverWait(self.driver, 10, poll_frequency=0.2).until(
+                    lambda driver: driver.execute_script(script)
+                )
+            except TimeoutException:
+                result = 'not_found'
 
             if result == 'success':
                 logger.info(f"[SUCCESS]Extension is now enabled")
-                time.sleep(1)
+                # Wait for the toggle to report the new state rather than sleeping a fixed second
+                try:
+                    WebDriverWait(self.driver, 5, poll_frequency=0.2).until(
+                        lambda driver: driver.execute_script(script) == 'already_enabled'
+                    )
+                except TimeoutException:
+                    logger.warning("Extension toggle did not report enabled state in time")
             else:
                 logger.info(f"Extension toggle state: {result}")
 
@@ -616,7 +1186,12 @@ class NetworkAnalyzer:
         Activate the extension by navigating to its popup URL.
         - IdleForest: Clicks "Start Planting" button
         - SupportWithMellowtel: No interaction needed, popup opens automatically
+        Runs once per Chrome session: the extension keeps its activated state across navigations
+        because every site is visited in the same profile. Returns True once activated.
         """
+        if self.extension_activated:
+            return True
+
         if not self.extension_id:
             logger.warning("Extension ID not available. Skipping activation.")
             return False
@@ -634,7 +1209,6 @@ class NetworkAnalyzer:
             for popup_attempt in range(max_retries):
                 try:
                     self.driver.get(popup_url)
-                    time.sleep(2)
                     logger.info(f"[SUCCESS]Navigated to extension popup: {popup_url}")
                     break  # Success
                 except TimeoutException as e:
@@ -662,28 +1236,7 @@ class NetworkAnalyzer:
                 # IdleForest requires clicking "Start Planting" button
                 logger.info("Looking for 'Start Planting' button...")
 
-                # Wait a bit for any dynamic content to load
-                time.sleep(2)
-
                 try:
-                    # First, list all buttons to help debug
-                    list_buttons_script = """
-                    const buttons = document.querySelectorAll('button');
-                    const buttonInfo = [];
-                    buttons.forEach((button, index) => {
-                        buttonInfo.push({
-                            index: index,
-                            innerText: button.innerText,
-                            textContent: button.textContent,
-                            innerHTML: button.innerHTML
-                        });
-                    });
-                    return buttonInfo;
-                    """
-
-                    all_buttons = self.driver.execute_script(list_buttons_script)
-                    logger.info(f"Found {len(all_buttons)} button(s) in popup:")
-
                     # Find button with text containing "Start Planting" (case-insensitive)
                     find_button_script = """
                     const buttons = document.querySelectorAll('button');
@@ -699,7 +1252,13 @@ class NetworkAnalyzer:
                     return null;
                     """
 
-                    start_button = self.driver.execute_script(find_button_script)
+                    # Poll until the popup has rendered the button (page load strategy is 'none')
+                    try:
+                        start_button = WebDriverWait(self.driver, 10, poll_frequency=0.2).until(
+                            lambda driver: driver.execute_script(find_button_script)
+                        )
+                    except TimeoutException:
+                        start_button = None
 
                     if start_button:
                         logger.info("[SUCCESS]Found 'Start Planting' button!")
@@ -707,6 +1266,7 @@ class NetworkAnalyzer:
 
                         # Click the button
                         self.driver.execute_script("arguments[0].click();", start_button)
+                        # Give the popup's click handler time to persist the extension state before navigating away
                         time.sleep(2)
                         logger.info("[SUCCESS]Clicked 'Start Planting' button")
 
@@ -716,7 +1276,6 @@ class NetworkAnalyzer:
                         for back_attempt in range(max_retries):
                             try:
                                 self.driver.get(original_url)
-                                time.sleep(2)
                                 logger.info("Back on site")
                                 break
                             except TimeoutException as e:
@@ -739,6 +1298,7 @@ class NetworkAnalyzer:
                                 else:
                                     raise
 
+                        self.extension_activated = True
                         return True
                     else:
                         logger.error("'Start Planting' button not found in popup!")
@@ -755,7 +1315,13 @@ class NetworkAnalyzer:
             else:
                 # SupportWithMellowtel: Just wait for popup to appear, no interaction needed
                 logger.info("SupportWithMellowtel popup opened. No interaction required.")
-                time.sleep(3)  # Wait for popup to fully load
+                # Wait for popup to fully load
+                try:
+                    WebDriverWait(self.driver, 10, poll_frequency=0.2).until(
+                        lambda driver: driver.execute_script("return document.readyState") == 'complete'
+                    )
+                except TimeoutException:
+                    logger.warning("Popup did not finish loading within 10s, continuing")
 
                 # Navigate back to original site
                 logger.info(f"Navigating back to site: {original_url}")
@@ -763,7 +1329,6 @@ class NetworkAnalyzer:
                 for back_attempt in range(max_retries):
                     try:
                         self.driver.get(original_url)
-                        time.sleep(2)
                         logger.info("Back on site")
                         break
                     except TimeoutException as e:
@@ -786,6 +1351,7 @@ class NetworkAnalyzer:
                         else:
                             raise
 
+                self.extension_activated = True
                 return True
 
         except Exception as e:
@@ -795,33 +1361,34 @@ class NetworkAnalyzer:
             logger.error("Extension activation failed. Exiting script.")
             sys.exit(1)
 
-    def extract_request_data(self, request) -> Dict[str, Any]:
+    def extract_request_data(self, request) -> RequestRecord:
         """Extract relevant data from a request object."""
-        try:
-            # Extract request headers
-            request_headers = {}
-            if hasattr(request, 'headers'):
-                request_headers = dict(request.headers)
-
-            # Extract response data if available
-            response_data = {}
-            if request.response:
-                response_data = {
-                    'status_code': request.response.status_code,
-                    'reason': request.response.reason,
-                    'headers': dict(request.response.headers) if hasattr(request.response, 'headers') else {}
-                }
-
-            return {
-                'timestamp': int(datetime.utcnow().timestamp()),
-                'url': request.url,
-                'method': request.method,
-                'request_headers': request_headers,
-                'response': response_data if request.response else None,
+        # Keep references to the header objects; they are converted to JSON objects by the writer
+        # thread (see _encode_headers), not on the monitoring loop
+        capture_headers = self.capture_headers
+        request_headers = request.headers if capture_headers else {}
+
+        # Extract response data if available (looked up once; it is a property on selenium-wire requests)
+        response = request.response
+        response_data = None
+        if response is not None:
+            response_data = {
+                'status_code': response.status_code,
+                'reason': response.reason,
+                'headers': response.headers if capture_headers else {}
             }
-        except Exception as e:
-            logger.warning(f"Error extracting request data: {e}")
-            return None
+
+        # selenium-wire stamps the request object it hands to the interceptor; prefer that over the processing time
+        captured_at = getattr(request, 'date', None)
+        timestamp = int(captured_at.timestamp()) if captured_at is not None else int(time.time())
+
+        return RequestRecord(
+            timestamp=timestamp,
+            url=request.url,
+            method=request.method,
+            request_headers=request_headers,
+            response=response_data,
+        )
 
     def check_for_mellowtel_iframes(self) -> List[Dict[str, str]]:
         """
@@ -829,79 +1396,93 @@ class NetworkAnalyzer:
         Returns list of iframe metadata dictionaries with all HTML attributes.
         """
         try:
-            script = """
-            const iframes = document.querySelectorAll('iframe');
-            const mellowtelIframes = [];
-
-            iframes.forEach(iframe => {
-                const id = iframe.getAttribute('id') || '';
-                const dataId = iframe.getAttribute('data-id') || '';
-
-                if (id.includes('mllwtl') || dataId.includes('mllwtl')) {
-                    const src = iframe.getAttribute('src') || '';
-                    if (src) {
-                        // Extract all attributes
-                        const allAttributes = {};
-                        for (let attr of iframe.attributes) {
-                            allAttributes[attr.name] = attr.value;
-                        }
-
-                        mellowtelIframes.push({
-                            src: src,
-                            id: id,
-                            dataId: dataId,
-                            allAttributes: allAttributes
-                        });
-                    }
-                }
-            });
+            result = self.driver.execute_script(IFRAME_PROBE_CALL_JS)
+            if result == IFRAME_PROBE_MISSING:
+                result = self.driver.execute_script(IFRAME_PROBE_JS)
+            return self._apply_iframe_scan(result)
 
-            return mellowtelIframes;
-            """
-
-            result = self.driver.execute_script(script)
+        except Exception as e:
+            logger.warning(f"Error checking for Mellowtel iframes: {e}")
+            return []
 
-            if result:
-                return result
-            else:
-                return []
+    def wait_for_mellowtel_iframes(self, timeout: float) -> List[Dict[str, str]]:
+        """
+        Like check_for_mellowtel_iframes, but first blocks inside the page (one WebDriver round-trip)
+        until a Mellowtel-relevant iframe change happens or timeout seconds pass.
+        Iframe insertions are therefore picked up immediately instead of at the next poll.
+        """
+        try:
+            timeout_ms = int(max(0.0, timeout) * 1000)
+            result = self.driver.execute_async_script(IFRAME_WAIT_CALL_JS, timeout_ms)
+            if result == IFRAME_PROBE_MISSING:
+                result = self.driver.execute_async_script(IFRAME_WAIT_JS, timeout_ms)
+            return self._apply_iframe_scan(result)
 
         except Exception as e:
-            logger.warning(f"Error checking for Mellowtel iframes: {e}")
+            logger.warning(f"Error waiting for Mellowtel iframes: {e}")
+            time.sleep(max(0.0, timeout))
             return []
 
+    def _apply_iframe_scan(self, result: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """Resolve a probe result, reusing the previous scan when the probe reports no change."""
+        if result is None:
+            # No iframe change since the last scan of this document
+            return self._last_iframe_scan
+
+        self._last_iframe_scan = result
+        return result
+
     def extract_domain(self, url: str) -> str:
         """
         Extract domain (netloc) from a URL.
         Returns empty string if URL is invalid.
         """
         try:
-            parsed = urlparse(url)
-            return parsed.netloc.lower()
+            return _netloc(url)
         except Exception:
             return ""
 
+    def _compile_mellowtel_pattern(self):
+        """
+        Compile the tracked iframe domains into a single regex anchored on the URL host.
+        Returns None while no domain is tracked. Must be rebuilt whenever self.mellowtel_domains changes.
+        """
+        if not self.mellowtel_domains:
+            return None
+        # Host (netloc) must equal a tracked iframe domain, same as extract_domain() comparison
+        domains = '|'.join(re.escape(domain) for domain in sorted(self.mellowtel_domains))
+        return re.compile(rf'^[A-Za-z][A-Za-z0-9+.-]*://(?i:{domains})(?:[/?#]|$)')
+
+    def _refresh_mellowtel_filter(self):
+        """Rebuild the domain pattern and drop cached match results. Call whenever self.mellowtel_domains changes."""
+        self._mellowtel_pattern = self._compile_mellowtel_pattern()
+        self._match_cache.clear()
+
     def is_mellowtel_request(self, request_url: str) -> bool:
         """
         Check if a request is Mellowtel-related.
         Returns True if:
         - URL contains 'request.mellow.tel'
         - Request domain matches any tracked Mellowtel iframe domain
+        Results are cached per URL (polling XHRs and refetched assets repeat) until the pattern changes.
         """
-        # Check for request.mellow.tel
-        if 'request.mellow.tel' in request_url:
-            return True
-
-        # Extract domain from request URL
-        request_domain = self.extract_domain(request_url)
-        if not request_domain:
-            return False
+        cached = self._match_cache.get(request_url)
+        if cached is not None:
+            return cached
 
-        # Check if request domain matches any tracked iframe domains
-        if request_domain in self.mellowtel_domains:
-            return True
+        # Plain substring check first; most URLs are rejected without entering the regex engine
+        if 'request.mellow.tel' in request_url:
+            result = True
+        elif self._mellowtel_pattern is None:
+            result = False
+        else:
+            # Anchored match: fails as soon as the host differs
+            result = self._mellowtel_pattern.match(request_url) is not None
 
-        return False
+        if len(self._match_cache) >= 4096:
+            self._match_cache.clear()
+        self._match_cache[request_url] = result
+        return result
 
     def update_iframe_metadata(self, iframe_data: Dict[str, str], current_time: float):
         """
@@ -929,30 +1510,33 @@ class NetworkAnalyzer:
     def save_iframe_metadata(self, site_url: str):
         """Save iframe metadata to JSONL file, including all HTML attributes."""
         try:
-            # Ensure output directory exists
-            Path(self.iframe_metadata_file).parent.mkdir(parents=True, exist_ok=True)
-
-            with open(self.iframe_metadata_file, 'a') as f:
-                for src, metadata in self.iframe_metadata.items():
-                    # Calculate duration
-                    duration = metadata['last_seen'] - metadata['first_seen']
-
-                    iframe_record = {
-                        'visited_site': site_url,
-                        'src': metadata['src'],
-                        'id': metadata['id'],
-                        'data_id': metadata['data_id'],
-                        'domain': metadata['domain'],
-                        'first_seen': metadata['first_seen'],
-                        'last_seen': metadata['last_seen'],
-                        'duration_seconds': duration,
-                        'all_attributes': metadata.get('all_attributes', {})
-                    }
+            records = []
+            for src, metadata in self.iframe_metadata.items():
+                # Calculate duration
+                duration = metadata['last_seen'] - metadata['first_seen']
+
+                iframe_record = {
+                    'visited_site': site_url,
+                    'src': metadata['src'],
+                    'id': metadata['id'],
+                    'data_id': metadata['data_id'],
+                    'domain': metadata['domain'],
+                    'first_seen': metadata['first_seen'],
+                    'last_seen': metadata['last_seen'],
+                    'duration_seconds': duration,
+                    'all_attributes': metadata.get('all_attributes', {})
+                }
+
+                records.append(iframe_record)
 
-                    # Write as JSON Lines format
-                    f.write(json.dumps(iframe_record) + '\n')
+            # Enqueue the records (non-blocking; written as JSON Lines on the writer thread)
+            self.file_writer.enqueue_jsonl(self.iframe_metadata_file, records)
 
-            logger.info(f"Saved metadata for {len(self.iframe_metadata)} iframe(s)")
+            # Each record is written once: the error paths of a site visit call this again on the
+            # way out, which would otherwise append the same iframes a second time
+            self.iframe_metadata.clear()
+
+            logger.info(f"Saved metadata for {len(records)} iframe(s)")
         except Exception as e:
             logger.error(f"Failed to save iframe metadata: {e}")
 
@@ -974,8 +1558,9 @@ class NetworkAnalyzer:
             if 'text' not in content_type:
                 return
 
-            # Ensure output directory exists
-            Path(self.post_payloads_dir).mkdir(parents=True, exist_ok=True)
+            # Ensure output directory exists (only needed before the first payload of the run)
+            if self.post_payload_counter == 0:
+                Path(self.post_payloads_dir).mkdir(parents=True, exist_ok=True)
 
             # Get request body
             body = None
@@ -989,39 +1574,18 @@ class NetworkAnalyzer:
             # Increment counter
             self.post_payload_counter += 1
 
-            # Create filename with timestamp, counter, and visited site
+            # Create filename with timestamp, counter, and visited site (one clock read for name and header)
+            now = datetime.now(timezone.utc)
             safe_site = site_url.replace('https://', '').replace('http://', '').replace('/', '_')[:50]
-            timestamp_str = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            timestamp_str = now.strftime('%Y%m%d_%H%M%S_%f')
             filename = f"post_payload_{self.post_payload_counter:04d}_{timestamp_str}_{safe_site}.txt"
             filepath = Path(self.post_payloads_dir) / filename
 
-            # Decode body if it's bytes
-            if isinstance(body, bytes):
-                try:
-                    body_text = body.decode('utf-8')
-                except UnicodeDecodeError:
-                    # If UTF-8 fails, try latin-1
-                    try:
-                        body_text = body.decode('latin-1')
-                    except:
-                        # Save as hex if decoding fails
-                        body_text = f"[Binary data, hex dump]:\n{body.hex()}"
-            else:
-                body_text = str(body)
-
-            # Save to file with metadata header
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"POST Payload Capture\n")
-                f.write(f"=" * 70 + "\n")
-                f.write(f"Timestamp: {datetime.utcnow().isoformat()}\n")
-                f.write(f"Visited Site: {site_url}\n")
-                f.write(f"URL: {request.url}\n")
-                f.write(f"Content-Type: {content_type}\n")
-                f.write(f"Content-Length: {len(body) if body else 0} bytes\n")
-                f.write(f"=" * 70 + "\n\n")
-                f.write(body_text)
-
-            logger.info(f"[POST]Saved POST payload to: {filename} ({len(body) if body else 0} bytes)")
+            # Decoding and formatting happen on the writer thread, overlapping the next poll
+            content = functools.partial(_format_post_payload, now, site_url, request.url, content_type, body)
+            self.file_writer.enqueue_write(str(filepath), content, mode='wb')
+
+            logger.info(f"[POST]Queued POST payload: {filename} ({len(body) if body else 0} bytes)")
 
         except Exception as e:
             logger.warning(f"Failed to save POST payload: {e}")
@@ -1034,75 +1598,49 @@ class NetworkAnalyzer:
         Stores requests in memory grouped by iframe URL.
         """
         try:
-            total_requests = len(self.driver.requests)
-
-            # Only process new requests since last check
-            if self.last_processed_request_index >= total_requests:
+            # Drain the requests streamed in by the response interceptor since the last check. Each request
+            # arrives exactly once and its response is complete, so nothing here iterates live proxy state.
+            requests = self._drain_captured_requests()
+            if not requests:
                 return  # No new requests
 
             new_request_count = 0
+            save_post_payload = self.save_post_payload
+            is_mellowtel_request = self.is_mellowtel_request
+            iframe_domains = self.iframe_domains
 
             # Process only new requests
-            for i in range(self.last_processed_request_index, total_requests):
+            for request in requests:
                 try:
-                    request = self.driver.requests[i]
+                    url = request.url
 
                     # Check and save POST payloads if applicable
-                    self.save_post_payload(request, site_url)
+                    save_post_payload(request, site_url)
 
                     # Filter for Mellowtel-related requests only
-                    if self.is_mellowtel_request(request.url):
+                    if is_mellowtel_request(url):
                         request_data = self.extract_request_data(request)
-                        if request_data:
-                            # Add metadata about which site triggered this request
-                            request_data['visited_site'] = site_url
-
-                            # Determine which iframe this request belongs to
-                            request_domain = self.extract_domain(request.url)
-
-                            # Check if it's a request to request.mellow.tel
-                            if 'request.mellow.tel' in request.url:
-                                # Use Referer header to match to specific iframe
-                                referer = request_data['request_headers'].get('Referer') or request_data['request_headers'].get('referer')
-
-                                if referer:
-                                    referer_domain = self.extract_domain(referer)
-                                    matched = False
-
-                                    # Find matching iframe by domain
-                                    for iframe_url in self.current_visible_iframes:
-                                        iframe_domain = self.extract_domain(iframe_url)
-                                        if referer_domain == iframe_domain:
-                                            # Attribute to this specific iframe only
-                                            if iframe_url not in self.iframe_requests:
-                                                self.iframe_requests[iframe_url] = {
-                                                    'domain': iframe_domain,
-                                                    'requests': []
-                                                }
-                                            self.iframe_requests[iframe_url]['requests'].append(request_data)
-                                            new_request_count += 1
-                                            matched = True
-                                            break
-
-                                    if not matched:
-                                        logger.warning(f"Could not match Referer domain '{referer_domain}' to any visible iframe")
-                                else:
-                                    # Fallback: no referer, attribute to all current iframes (original behavior)
-                                    logger.warning(f"No Referer header for request.mellow.tel request, attributing to all iframes")
-                                    for iframe_url in self.current_visible_iframes:
-                                        if iframe_url not in self.iframe_requests:
-                                            iframe_domain = self.extract_domain(iframe_url)
-                                            self.iframe_requests[iframe_url] = {
-                                                'domain': iframe_domain,
-                                                'requests': []
-                                            }
-                                        self.iframe_requests[iframe_url]['requests'].append(request_data.copy())
-                                        new_request_count += 1
-                            else:
-                                # Match request to iframe by domain
+                        # Add metadata about which site triggered this request
+                        request_data.visited_site = site_url
+
+                        # Determine which iframe this request belongs to
+                        request_domain = self.extract_domain(url)
+
+                        # Check if it's a request to request.mellow.tel
+                        if 'request.mellow.tel' in url:
+                            # Use Referer header to match to specific iframe (read from the request itself:
+                            # the record's headers are empty when CAPTURE_HEADERS=false; lookup is case-insensitive)
+                            referer = request.headers.get('Referer')
+
+                            if referer:
+                                referer_domain = self.extract_domain(referer)
+                                matched = False
+
+                                # Find matching iframe by domain
                                 for iframe_url in self.current_visible_iframes:
-                                    iframe_domain = self.extract_domain(iframe_url)
-                                    if request_domain == iframe_domain:
+                                    iframe_domain = iframe_domains.get(iframe_url) or self.extract_domain(iframe_url)
+                                    if referer_domain == iframe_domain:
+                                        # Attribute to this specific iframe only
                                         if iframe_url not in self.iframe_requests:
                                             self.iframe_requests[iframe_url] = {
                                                 'domain': iframe_domain,
@@ -1110,25 +1648,67 @@ class NetworkAnalyzer:
                                             }
                                         self.iframe_requests[iframe_url]['requests'].append(request_data)
                                         new_request_count += 1
+                                        matched = True
                                         break
 
-                except RuntimeError as e:
-                    if "dictionary changed size during iteration" in str(e):
-                        # Skip this request and continue
-                        logger.warning(f"RuntimeError processing request {i}, skipping")
-                        continue
-                    else:
-                        raise
+                                if not matched:
+                                    logger.warning(f"Could not match Referer domain '{referer_domain}' to any visible iframe")
+                            else:
+                                # Fallback: no referer, attribute to all current iframes (original behavior)
+                                logger.warning(f"No Referer header for request.mellow.tel request, attributing to all iframes")
+                                for iframe_url in self.current_visible_iframes:
+                                    if iframe_url not in self.iframe_requests:
+                                        iframe_domain = iframe_domains.get(iframe_url) or self.extract_domain(iframe_url)
+                                        self.iframe_requests[iframe_url] = {
+                                            'domain': iframe_domain,
+                                            'requests': []
+                                        }
+                                    self.iframe_requests[iframe_url]['requests'].append(replace(request_data))
+                                    new_request_count += 1
+                        else:
+                            # Match request to iframe by domain
+                            for iframe_url in self.current_visible_iframes:
+                                iframe_domain = iframe_domains.get(iframe_url) or self.extract_domain(iframe_url)
+                                if request_domain == iframe_domain:
+                                    if iframe_url not in self.iframe_requests:
+                                        self.iframe_requests[iframe_url] = {
+                                            'domain': iframe_domain,
+                                            'requests': []
+                                        }
+                                    self.iframe_requests[iframe_url]['requests'].append(request_data)
+                                    new_request_count += 1
+                                    break
 
-            # Update the last processed index
-            self.last_processed_request_index = total_requests
+                except Exception as e:
+                    # Confine failures to this request; the rest of the drained batch is not re-queued
+                    logger.warning(f"Error processing request {getattr(request, 'url', '?')}: {e}")
+                    continue
 
             if new_request_count > 0:
+                self.last_mellowtel_activity = time.monotonic()
                 logger.info(f"Processed {new_request_count} new Mellowtel request(s)")
 
         except Exception as e:
             logger.error(f"Failed to process new requests: {e}")
 
+    def _drain_captured_requests(self) -> list:
+        """Return (and remove) every request queued by the response interceptor so far."""
+        requests = []
+        try:
+            while True:
+                requests.append(self._captured_requests.get_nowait())
+        except queue.Empty:
+            pass
+        return requests
+
+    def _attribute_iframe_requests(self, iframe_url: str, iframe_data: Dict[str, Any]) -> List[RequestRecord]:
+        """Stamp iframe attribution onto an iframe's aggregated requests and return them."""
+        requests = iframe_data['requests']
+        for request_data in requests:
+            request_data.iframe_src = iframe_url
+            request_data.iframe_domain = iframe_data['domain']
+        return requests
+
     def write_iframe_requests(self, iframe_url: str):
         """
         Write all aggregated requests for a specific iframe to the output file.
@@ -1143,19 +1723,8 @@ class NetworkAnalyzer:
             request_count = len(iframe_data['requests'])
 
             if request_count > 0:
-                # Build content in memory
-                content_lines = []
-                for request_data in iframe_data['requests']:
-                    # Add iframe attribution
-                    request_data['iframe_src'] = iframe_url
-                    request_data['iframe_domain'] = iframe_data['domain']
-
-                    # Add as JSON Lines format
-                    content_lines.append(json.dumps(request_data) + '\n')
-
-                # Enqueue the write (non-blocking)
-                content = ''.join(content_lines)
-                self.file_writer.enqueue_write(self.output_file, content, mode='a')
+                # Enqueue the records (non-blocking; serialized on the writer thread)
+                self.file_writer.enqueue_jsonl(self.output_file, self._attribute_iframe_requests(iframe_url, iframe_data))
 
                 logger.info(f"[WRITE]Queued {request_count} requests for iframe: {iframe_data['domain']}")
 
@@ -1176,28 +1745,20 @@ class NetworkAnalyzer:
                 logger.info("No remaining requests to write")
                 return
 
+            # Collect all iframes' records so the site ends with a single write
             total_queued = 0
+            records = []
             for iframe_url, iframe_data in list(self.iframe_requests.items()):
                 request_count = len(iframe_data['requests'])
 
                 if request_count > 0:
-                    # Build content in memory
-                    content_lines = []
-                    for request_data in iframe_data['requests']:
-                        # Add iframe attribution
-                        request_data['iframe_src'] = iframe_url
-                        request_data['iframe_domain'] = iframe_data['domain']
-
-                        # Add as JSON Lines format
-                        content_lines.append(json.dumps(request_data) + '\n')
-
-                    # Enqueue the write (non-blocking)
-                    content = ''.join(content_lines)
-                    self.file_writer.enqueue_write(self.output_file, content, mode='a')
-
+                    records.extend(self._attribute_iframe_requests(iframe_url, iframe_data))
                     total_queued += request_count
                     logger.info(f"[WRITE]Queued {request_count} remaining requests for iframe: {iframe_data['domain']}")
 
+            # Enqueue the records (non-blocking; serialized on the writer thread)
+            self.file_writer.enqueue_jsonl(self.output_file, records)
+
             # Clear all
             self.iframe_requests.clear()
             logger.info(f"Total remaining requests queued: {total_queued}")
@@ -1205,12 +1766,26 @@ class NetworkAnalyzer:
         except Exception as e:
             logger.error(f"Failed to queue remaining requests: {e}")
 
+    def get_resource_count(self) -> Optional[int]:
+        """Return the page's resource timing entry count, or None if it cannot be read."""
+        try:
+            # Raise the default 250-entry buffer so a busy page does not look quiet once it fills up
+            return self.driver.execute_script(
+                "performance.setResourceTimingBufferSize(100000);"
+                "return performance.getEntriesByType('resource').length;"
+            )
+        except WebDriverException:
+            return None
+
     def scroll_page(self):
         """Scroll down the page a bit."""
         try:
-            # Scroll down by 500 pixels
-            self.driver.execute_script("window.scrollBy(0, 500);")
-            logger.info("Scrolled down 500 pixels")
+            # Scroll down by 500 pixels with a trusted wheel event at the viewport centre (1920x1080 window):
+            # unlike scrollBy it also reaches wheel listeners, like a real user scrolling
+            self.driver.execute_cdp_cmd('Input.dispatchMouseEvent', {
+                'type': 'mouseWheel', 'x': 960, 'y': 540, 'deltaX': 0, 'deltaY': 500,
+            })
+            logger.debug("Scrolled down 500 pixels")
         except Exception as e:
             logger.warning(f"Error scrolling page: {e}")
 
@@ -1222,10 +1797,12 @@ class NetworkAnalyzer:
             if len(windows) > 1:
                 logger.info(f"Closing {len(windows) - 1} extra tab(s)...")
 
-                # Keep the first tab, close all others
-                for i in range(len(windows) - 1, 0, -1):
-                    self.driver.switch_to.window(windows[i])
-                    self.driver.close()
+                # Keep the first tab, close all others via CDP (window handles are CDP target IDs),
+                # avoiding a switch_to.window + close round-trip per tab
+                targets = self.driver.execute_cdp_cmd('Target.getTargets', {})['targetInfos']
+                for target in targets:
+                    if target['type'] == 'page' and target['targetId'] != windows[0]:
+                        self.driver.execute_cdp_cmd('Target.closeTarget', {'targetId': target['targetId']})
 
                 # Switch back to the first (remaining) tab
                 self.driver.switch_to.window(windows[0])
@@ -1242,6 +1819,32 @@ class NetworkAnalyzer:
             except:
                 pass
 
+    def reset_page(self):
+        """Navigate the remaining tab to about:blank and drop cookies left by the previous site."""
+        try:
+            self.driver.get('about:blank')
+            # delete_all_cookies() only covers the current document's domain, which on about:blank is none
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except WebDriverException as e:
+            logger.warning(f"Could not reset page before next site: {e}")
+
+    def wait_for_dom_ready(self, navigation_start_ms: float, timeout: float = 10):
+        """
+        Block until the document navigated to after navigation_start_ms (epoch ms) has been parsed
+        (DOMContentLoaded), at most timeout seconds. With page_load_strategy 'none' driver.get()
+        returns before the new document exists, so the first iframe probe could otherwise hit the
+        previous page (whether or not reset_page reached about:blank); subresources are never waited for.
+        """
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.2, ignored_exceptions=(WebDriverException,)).until(
+                lambda driver: driver.execute_script(
+                    "return performance.timeOrigin >= arguments[0] && document.readyState !== 'loading';",
+                    navigation_start_ms - 50
+                )
+            )
+        except TimeoutException:
+            logger.warning(f"Document not ready after {timeout}s, monitoring anyway")
+
     def visit_site(self, url: str, index: int, total: int):
         """Visit a single site and capture network activity."""
         logger.info(f"\n[{index}/{total}] Visiting: {url}")
@@ -1267,7 +1870,11 @@ class NetworkAnalyzer:
                 # Close all tabs except one to start fresh
                 self.close_all_tabs_except_one()
 
+                # Unload the previous site so its timers and pending fetches stop before capture restarts
+                self.reset_page()
+
                 # Clear previous requests and iframe tracking
+                # (del clears selenium-wire's storage in place; driver.requests only returns a copy)
                 try:
                     del self.driver.requests
                 except RuntimeError as e:
@@ -1277,10 +1884,12 @@ class NetworkAnalyzer:
 
                 self.mellowtel_iframe_urls.clear()
                 self.mellowtel_domains.clear()
+                self.iframe_domains.clear()
+                self._refresh_mellowtel_filter()
                 self.iframe_metadata.clear()
                 self.iframe_requests.clear()
                 self.current_visible_iframes.clear()
-                self.last_processed_request_index = 0
+                self._drain_captured_requests()  # Discard late responses from the previous site
 
                 # Navigation with RuntimeError retry logic
                 max_retries = 3
@@ -1288,7 +1897,9 @@ class NetworkAnalyzer:
                 for nav_attempt in range(max_retries):
                     try:
                         # Navigate to the URL
+                        navigation_start_ms = time.time() * 1000
                         self.driver.get(url)
+                        self.wait_for_dom_ready(navigation_start_ms)
                         logger.info(f"Page loaded.")
                         nav_success = True
                         break  # Success, exit retry loop
@@ -1350,12 +1961,10 @@ class NetworkAnalyzer:
         """Process site after successful navigation. Extracted from visit_site for clarity."""
         try:
             # Set monitoring start time
-            self.monitoring_start_time = time.time()
+            self.monitoring_start_time = time.monotonic()
 
             # Activate the IdleForest extension only once (before the first site)
-            if not self.extension_activated:
-                self.activate_extension()
-                self.extension_activated = True
+            if not self.extension_activated and self.activate_extension():
                 logger.info(f"Extension activated. This will not be repeated for subsequent sites.")
 
             logger.info(f"Monitoring for Mellowtel iframe injection for {self.max_wait_for_iframe} seconds...")
@@ -1363,37 +1972,55 @@ class NetworkAnalyzer:
             # Poll for Mellowtel iframe detection continuously
             elapsed = 0
             last_scroll_time = 0  # Track when we last scrolled
+            next_poll_time = self.monitoring_start_time  # Fixed-rate schedule: poll cost is not added to the interval
+            idle_polls = 0  # Consecutive polls without a visible Mellowtel iframe
             total_iframes_found = 0
 
+            seen_iframes = self.mellowtel_iframe_urls
+            last_iframe_data_list = None
+            iframe_data_list = self.check_for_mellowtel_iframes()
             while elapsed < self.max_wait_for_iframe:
-                iframe_data_list = self.check_for_mellowtel_iframes()
-
                 # Get currently visible iframe URLs
                 currently_visible = set()
                 if iframe_data_list:
-                    current_time = time.time() - self.monitoring_start_time
+                    current_time = time.monotonic() - self.monitoring_start_time
 
                     # Update metadata for all currently visible iframes
                     for iframe_data in iframe_data_list:
                         self.update_iframe_metadata(iframe_data, current_time)
 
-                    # Extract URLs for currently visible iframes
-                    currently_visible = set(iframe['src'] for iframe in iframe_data_list)
-
-                    # Detect new iframes
-                    new_iframes = currently_visible - self.mellowtel_iframe_urls
+                    if iframe_data_list is last_iframe_data_list:
+                        # Unchanged scan (same list object): the visible set is already built
+                        currently_visible = self.current_visible_iframes
+                        new_iframes = ()
+                    else:
+                        # Build the visible set and detect new iframes in one pass; interned
+                        # src strings make repeat lookups a pointer compare
+                        new_iframes = []
+                        for iframe_data in iframe_data_list:
+                            src = sys.intern(iframe_data['src'])
+                            currently_visible.add(src)
+                            if src not in seen_iframes:
+                                seen_iframes.add(src)
+                                new_iframes.append(src)
 
                     if new_iframes:
-                        self.mellowtel_iframe_urls.update(new_iframes)
-
                         # Extract and track domains from new iframe URLs
+                        domains_added = False
                         for iframe_url in new_iframes:
                             domain = self.extract_domain(iframe_url)
-                            if domain:
+                            self.iframe_domains[iframe_url] = domain
+                            if domain and domain not in self.mellowtel_domains:
                                 self.mellowtel_domains.add(domain)
+                                domains_added = True
                                 logger.info(f"Tracking new domain: {domain}")
 
+                        # New iframe URLs often reuse a tracked domain; only recompile when the set grew
+                        if domains_added:
+                            self._refresh_mellowtel_filter()
+
                         total_iframes_found = len(self.mellowtel_iframe_urls)
+                        self.last_mellowtel_activity = time.monotonic()
                         logger.info(f"[SUCCESS]New Mellowtel iframe(s) detected! Total tracking: {total_iframes_found} iframe URL(s) and {len(self.mellowtel_domains)} domain(s)")
 
                 # Detect disappeared iframes (iframes that were visible but are no longer)
@@ -1409,6 +2036,7 @@ class NetworkAnalyzer:
 
                 # Update current visible iframes
                 self.current_visible_iframes = currently_visible
+                last_iframe_data_list = iframe_data_list
 
                 # Process new requests on each iteration
                 self.process_new_requests(url)
@@ -1418,9 +2046,32 @@ class NetworkAnalyzer:
                     self.scroll_page()
                     last_scroll_time = elapsed
 
-                # Wait before next poll
-                time.sleep(self.iframe_poll_interval)
-                elapsed = int(time.time() - self.monitoring_start_time)
+                # Optional early exit once Mellowtel has gone quiet (requires an iframe to have been seen)
+                if (self.quiescence_timeout > 0 and total_iframes_found > 0
+                        and time.monotonic() - self.last_mellowtel_activity >= self.quiescence_timeout):
+                    logger.info(f"No Mellowtel activity for {self.quiescence_timeout}s, ending monitoring after {elapsed:.0f}s")
+                    break
+
+                # Back off while no Mellowtel iframe is visible: the in-page wait still returns as soon as
+                # one is inserted, so only idle round-trips are saved. Visible iframes keep the base rate,
+                # which bounds the error of their last_seen times.
+                if currently_visible:
+                    idle_polls = 0
+                    poll_interval = self.iframe_poll_interval
+                else:
+                    idle_polls = min(idle_polls + 1, 8)
+                    poll_interval = min(self.iframe_poll_max, self.iframe_poll_interval * 2 ** idle_polls)
+
+                # Wait in the page until the next scheduled poll; an iframe change ends the wait early
+                # without shifting the schedule (the 50 ms slack absorbs browser timer jitter)
+                now = time.monotonic()
+                if next_poll_time <= now + 0.05:
+                    next_poll_time += poll_interval
+                # (never past the end of the monitoring window, which a backed-off poll could overshoot)
+                next_poll_time = min(next_poll_time, now + poll_interval,
+                                     self.monitoring_start_time + self.max_wait_for_iframe)
+                iframe_data_list = self.wait_for_mellowtel_iframes(next_poll_time - time.monotonic())
+                elapsed = time.monotonic() - self.monitoring_start_time
 
             # Summary of monitoring period
             if total_iframes_found > 0:
@@ -1429,17 +2080,31 @@ class NetworkAnalyzer:
                 logger.warning(f"No Mellowtel iframes detected after {self.max_wait_for_iframe} seconds")
                 logger.info(f"Waiting {self.dwell_time} seconds for any potential Mellowtel activity...")
 
-                # Additional wait with scrolling if no iframes found
-                wait_elapsed = 0
+                # Additional wait with scrolling if no iframes found; ends early once the page goes quiet
+                wait_start = time.monotonic()
+                wait_elapsed = 0.0
+                last_scroll_time = 0.0
+                last_resource_count = None
+                quiet_since = wait_start
                 while wait_elapsed < self.dwell_time:
                     # Scroll every 60 seconds
-                    if wait_elapsed > 0 and wait_elapsed % 60 == 0:
+                    if wait_elapsed - last_scroll_time >= 60:
                         self.scroll_page()
+                        last_scroll_time = wait_elapsed
+
+                    if self.dwell_quiet_period > 0:
+                        resource_count = self.get_resource_count()
+                        if resource_count is not None:
+                            if resource_count != last_resource_count:
+                                last_resource_count = resource_count
+                                quiet_since = time.monotonic()
+                            elif time.monotonic() - quiet_since >= self.dwell_quiet_period:
+                                logger.info(f"No new resources for {self.dwell_quiet_period}s, ending dwell after {wait_elapsed:.0f}s")
+                                break
 
                     # Wait in small increments
-                    sleep_time = min(self.iframe_poll_interval, self.dwell_time - wait_elapsed)
-                    time.sleep(sleep_time)
-                    wait_elapsed += sleep_time
+                    time.sleep(min(self.iframe_poll_interval, self.dwell_time - wait_elapsed))
+                    wait_elapsed = time.monotonic() - wait_start
 
             # Process any final new requests
             logger.info(f"Processing final requests...")
@@ -1467,42 +2132,88 @@ class NetworkAnalyzer:
             # Re-raise to be handled by visit_site()
             raise
 
-    def run_experiment(self):
-        """Main experiment execution."""
-        logger.info("=" * 70)
-        logger.info("Mellowtel SDK Network Analysis Tool - Targeted Capture Mode")
-        logger.info("=" * 70)
-        logger.info(f"Configuration:")
-        logger.info(f"  - Iframe detection polling: every {self.iframe_poll_interval} seconds")
-        logger.info(f"  - Max wait for iframe: {self.max_wait_for_iframe} seconds")
-        logger.info(f"  - Fallback dwell time: {self.dwell_time} seconds (if no iframe detected)")
-        logger.info(f"  - Headless mode: {self.headless}")
-        logger.info(f"  - Disable images: {self.disable_images}")
-        logger.info(f"  - Output directory: {self.run_dir}/")
-        logger.info(f"    - Network logs: network_logs.jsonl")
-        logger.info(f"    - Iframe metadata: iframe_metadata.jsonl")
-        logger.info(f"    - POST payloads: post_payloads/")
-        logger.info(f"\nFiltering & Aggregation:")
-        logger.info(f"  - Only capturing requests to 'request.mellow.tel'")
-        logger.info(f"  - Only capturing requests with same domain as Mellowtel iframes")
-        logger.info(f"  - Detecting iframes with 'mllwtl' in id/data-id attributes")
-        logger.info(f"  - Tracking iframe presence duration")
-        logger.info(f"  - Categorizing requests by iframe/domain in real-time")
-        logger.info(f"  - Writing to file when iframe disappears from DOM")
-        logger.info(f"  - Saving POST payloads to request.mellow.tel with text content-type")
-        logger.info("=" * 70)
-
-        # Load sites
-        sites = self.load_sites()
+    def run_parallel(self, sites: List[str]):
+        """
+        Visit sites with a pool of PARALLEL_SITES worker processes, each driving its own warm Chrome.
+        Workers pull the next site from a shared queue, so a worker stuck on slow sites does not hold
+        back sites that idle workers could take. Shard JSONL files are concatenated into the run
+        directory once all workers finish.
+        """
+        num_workers = min(self.parallel_sites, len(sites))
+        logger.info(f"Visiting {len(sites)} sites with {num_workers} parallel Chrome instance(s)")
+
+        # spawn: worker processes must not inherit the logging/file-writer threads
+        mp_context = multiprocessing.get_context('spawn')
+        with mp_context.Manager() as manager, \
+                ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context, max_tasks_per_child=1) as executor:
+            site_queue = manager.Queue()
+            for site_index in range(len(sites)):
+                site_queue.put(site_index)
+
+            futures = {
+                executor.submit(_run_shard, shard_id, sites, self.extension_name, self.timestamp, site_queue): shard_id
+                for shard_id in range(num_workers)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    logger.info(f"[SUCCESS]Shard {futures[future]} finished")
+                except (Exception, SystemExit) as e:
+                    # Workers call sys.exit() on fatal setup errors; that must not end the parent
+                    logger.error(f"Shard {futures[future]} failed: {e!r}")
+
+        for filename in ('network_logs.jsonl', 'iframe_metadata.jsonl'):
+            with open(Path(self.run_dir) / filename, 'ab') as merged:
+                for shard_id in range(num_workers):
+                    shard_file = Path(self.run_dir) / f'shard_{shard_id}' / filename
+                    try:
+                        with open(shard_file, 'rb') as f:
+                            shutil.copyfileobj(f, merged)
+                    except FileNotFoundError:
+                        pass  # Shard visited no site that produced this file
+        logger.info(f"Merged shard outputs into {self.run_dir}/")
+
+    def _site_schedule(self, sites: List[str], site_queue=None):
+        """
+        Yield (1-based index, site) pairs to visit: every site in order, or, in a pooled worker,
+        whichever indices this worker takes from the shared site_queue until it is empty.
+        """
+        if site_queue is None:
+            yield from enumerate(sites, 1)
+            return
+
+        while True:
+            try:
+                site_index = site_queue.get_nowait()
+            except queue.Empty:
+                return
+            yield site_index + 1, sites[site_index]
+
+    def run_experiment(self, sites: Optional[List[str]] = None, site_queue=None):
+        """
+        Main experiment execution.
+        Pool workers pass the full site list plus the shared site_queue they take sites from.
+        """
+        logger.info(_BANNER.format_map(vars(self)))
+
+        # Load sites (worker processes receive their shard from the parent)
+        if sites is None:
+            sites = self.load_sites()
 
         if not sites:
             logger.error("No sites to visit. Exiting.")
             sys.exit(1)
 
         # Create run directory
-        Path(self.run_dir).mkdir(parents=True, exist_ok=True)
-        logger.info(f"Created output directory: {self.run_dir}/")
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        logger.info(f"Created output directory: {self.output_dir}/")
 
+        if self.shard_id is None and self.parallel_sites > 1:
+            try:
+                self.run_parallel(sites)
+            finally:
+                self.file_writer.shutdown()
+            return
 
         # Initialize driver with retry logic for TimeoutException
         max_init_retries = 2
@@ -1552,15 +2263,16 @@ class NetworkAnalyzer:
 
         try:
             # Visit each site
-            for idx, site in enumerate(sites, 1):
+            for idx, site in self._site_schedule(sites, site_queue):
                 # Check if more than 55 minutes have elapsed
                 elapsed_minutes = (time.time() - experiment_start_time) / 60
                 if elapsed_minutes > 55:
                     logger.info(f"\n55 minutes have elapsed ({elapsed_minutes:.1f} minutes). Finishing experiment early.")
-                    logger.info(f"Visited {idx - 1}/{len(sites)} sites before timeout.")
+                    logger.info(f"Stopped before site {idx}/{len(sites)} due to timeout.")
                     break
 
                 self.visit_site(site, idx, len(sites))
+                self.file_writer.flush()
 
             logger.info("\n" + "=" * 70)
             logger.info("Experiment completed successfully!")
@@ -1586,6 +2298,17 @@ class NetworkAnalyzer:
             if self.driver:
                 logger.info("Closing browser...")
                 self.driver.quit()
+            self._remove_temp_profile()
+
+
+def _run_shard(shard_id: int, sites: List[str], extension_name: str, timestamp: str, site_queue):
+    """Worker process entry point: visit sites taken from site_queue with a dedicated Chrome instance."""
+    try:
+        analyzer = NetworkAnalyzer(extension_name=extension_name, timestamp=timestamp, shard_id=shard_id)
+        analyzer.run_experiment(sites, site_queue=site_queue)
+    finally:
+        # Each worker runs a single shard (max_tasks_per_child=1), so flush its log queue before exiting
+        queue_listener.stop()
 
 
 def main():
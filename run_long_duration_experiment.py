@@ -5,24 +5,30 @@ Captures all network activity from Chrome browsing with extension installed.
 Visits https://yasirzaki.net for 23 hours to observe extended Mellowtel behavior.
 """
 
-import json
+import functools
 import logging
 import logging.handlers
 import os
 import queue
 import random
+import re
 import sys
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from urllib.parse import urlparse
 
+import orjson
+
 from seleniumwire import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import WebDriverException, TimeoutException
 
+from http_headers import copy_headers
+
 
 VERBOSE = '--verbose' in sys.argv
 
@@ -68,11 +74,34 @@ queue_listener.start()
 
 INTERESTING_URL_PATTERNS = ('speed.cloudflare', 'aim.cloudflare', 'mellowtel', 'mellow.tel', 'mllwtl')
 
+# Ad/analytics hosts that never carry Mellowtel traffic; Chrome connects to them without the proxy
+PROXY_EXCLUDED_HOSTS = (
+    '*.google-analytics.com',
+    '*.googletagmanager.com',
+    '*.doubleclick.net',
+    '*.googlesyndication.com',
+    '*.googleadservices.com',
+)
+
 
 def _is_interesting_url(url: str) -> bool:
     return any(p in url for p in INTERESTING_URL_PATTERNS)
 
 
+@functools.lru_cache(maxsize=16384)
+def _netloc(url: str) -> str:
+    """Lower-cased netloc of url, memoized: iframe srcs, Referers and request hosts repeat constantly."""
+    return urlparse(url).netloc.lower()
+
+
+def _canonical_headers(headers) -> Dict[str, str]:
+    """
+    Captured records stay in memory until their iframe disappears, so header names and
+    low-cardinality values share one string each (see http_headers.copy_headers).
+    """
+    return copy_headers(headers, intern=True)
+
+
 def _install_websocket_message_capture():
     """Monkey-patch selenium-wire's mitmproxy handler to capture WebSocket frames.
 
@@ -112,8 +141,12 @@ def _install_websocket_message_capture():
 class FileWriterQueue:
     """Thread-safe queue for async file writes to prevent I/O blocking."""
 
+    # Append-mode files stay open for the whole run behind a large userspace buffer
+    APPEND_BUFFER_SIZE = 1 << 20
+
     def __init__(self):
         self.write_queue = queue.Queue()
+        self._handles = {}  # (filepath, mode) -> open file, owned by the worker thread
         self.worker_thread = threading.Thread(target=self._worker, daemon=False)
         self.shutdown_event = threading.Event()
         self.worker_thread.start()
@@ -130,23 +163,60 @@ class FileWriterQueue:
                 # Execute the write task
                 filepath, content, mode = task
                 try:
-                    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-                    with open(filepath, mode) as f:
-                        f.write(content)
+                    if isinstance(content, list):
+                        # Records queued by enqueue_jsonl are serialized here, off the monitoring thread
+                        content = b'\n'.join(orjson.dumps(record) for record in content) + b'\n'
+                    if mode.startswith('a'):
+                        self._get_handle(filepath, mode).write(content)
+                    else:
+                        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+                        with open(filepath, mode) as f:
+                            f.write(content)
                 except Exception as e:
                     logger.error(f"Failed to write to {filepath}: {e}")
                 finally:
                     self.write_queue.task_done()
 
             except queue.Empty:
+                # Queue idle: hand buffered lines to the kernel (no-op when nothing is buffered)
+                for f in self._handles.values():
+                    f.flush()
                 continue
             except Exception as e:
                 logger.error(f"Error in FileWriterQueue worker: {e}")
 
-    def enqueue_write(self, filepath: str, content: str, mode: str = 'a'):
+        self._close_handles()
+
+    def _get_handle(self, filepath: str, mode: str):
+        """Return the cached append handle for filepath, opening it on first use."""
+        key = (filepath, mode)
+        f = self._handles.get(key)
+        if f is None:
+            Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+            f = open(filepath, mode, buffering=self.APPEND_BUFFER_SIZE)
+            self._handles[key] = f
+        return f
+
+    def _close_handles(self):
+        """Flush, fsync and close every cached append handle (the only fsync of the run)."""
+        for (filepath, _), f in self._handles.items():
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            except Exception as e:
+                logger.error(f"Failed to close {filepath}: {e}")
+        self._handles.clear()
+
+    def enqueue_write(self, filepath: str, content: Union[str, bytes], mode: str = 'a'):
         """Enqueue a file write operation."""
         self.write_queue.put((filepath, content, mode))
 
+    def enqueue_jsonl(self, filepath: str, records: List[Any]):
+        """Enqueue records to be serialized with orjson and appended as JSON Lines by the worker."""
+        if records:
+            self.write_queue.put((filepath, records, 'ab'))
+
     def shutdown(self, timeout: float = 30.0):
         """Shutdown the worker thread and wait for queue to drain."""
         logger.info(f"Shutting down FileWriterQueue (queue size: {self.write_queue.qsize()})...")
@@ -184,6 +254,8 @@ class NetworkAnalyzer:
         self.iframe_poll_interval = 2  # Check for iframe every 2 seconds
         self.headless = os.getenv('HEADLESS', 'false').lower() == 'true'
         self.disable_images = os.getenv('DISABLE_IMAGES', 'false').lower() == 'true'
+        self.debug_chrome = os.getenv('DEBUG_CHROME', '0') == '1'
+        self.chrome_profile_dir = os.getenv('CHROME_PROFILE_DIR', '')  # Persistent profile root; empty = fresh temporary profile
 
         # Randomly select extension from available options
         available_extensions = ['connectez.crx', 'disconnectez.crx']
@@ -192,7 +264,7 @@ class NetworkAnalyzer:
         logger.info(f"Selected extension: {self.extension_name}")
 
         # Generate timestamped output directory
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
         self.timestamp = timestamp
         self.run_dir = f'output/run_{timestamp}'
         self.output_file = f'{self.run_dir}/network_logs.jsonl'
@@ -202,6 +274,7 @@ class NetworkAnalyzer:
         self.driver = None
         self.mellowtel_iframe_urls = set()  # Track iframe URLs for filtering
         self.mellowtel_domains = set()  # Track iframe domains for filtering
+        self._mellowtel_pattern = None  # Compiled from mellowtel_domains; see _compile_mellowtel_pattern()
         self.iframe_metadata = {}  # Track iframe metadata: {src: {first_seen, last_seen, id, data_id, domain}}
         self.extension_id = None  # Store extension ID for activation
         self.extension_activated = False  # Track if extension has been activated
@@ -211,7 +284,7 @@ class NetworkAnalyzer:
         # Track requests per iframe/domain for aggregated writing
         self.iframe_requests = {}  # {iframe_src: {'domain': str, 'requests': [request_data]}}
         self.current_visible_iframes = set()  # Currently visible iframe URLs
-        self.last_processed_request_index = 0  # Track which requests we've already processed
+        self._captured_requests = queue.SimpleQueue()  # Filled by the response interceptor on proxy threads
 
 
     def setup_chrome_options(self) -> Options:
@@ -234,15 +307,22 @@ class NetworkAnalyzer:
         else:
             logger.info("Using Xvfb virtual display (User-Agent will show normal 'Chrome')")
 
-        # Remote debugging (helps with stability)
-        chrome_options.add_argument('--remote-debugging-port=9222')
-
         # Window size
         chrome_options.add_argument('--window-size=1920,1080')
 
-        # Set unique user data directory to avoid conflicts
-        import tempfile
-        user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
+        if self.chrome_profile_dir:
+            # Persistent profile: HTTP cache and extension state survive across runs (one profile per extension)
+            user_data_dir = str(Path(self.chrome_profile_dir) / self.extension_name)
+            Path(user_data_dir).mkdir(parents=True, exist_ok=True)
+            # A previous run killed mid-session leaves Chrome's singleton lock behind
+            for lock_name in ('SingletonLock', 'SingletonSocket', 'SingletonCookie'):
+                lock_path = Path(user_data_dir) / lock_name
+                lock_path.unlink(missing_ok=True)  # Also removes dangling symlinks, which exists() misses
+            chrome_options.add_argument('--profile-directory=Default')
+        else:
+            # Set unique user data directory to avoid conflicts
+            import tempfile
+            user_data_dir = tempfile.mkdtemp(prefix='chrome_profile_')
         chrome_options.add_argument(f'--user-data-dir={user_data_dir}')
         logger.info(f"Using user data directory: {user_data_dir}")
 
@@ -282,9 +362,14 @@ class NetworkAnalyzer:
             logger.warning(f"Extension file not found: {self.extension_path}")
             logger.warning("Continuing without extension. Network capture will only include page requests.")
 
-        # Logging for debugging
-        chrome_options.add_argument('--enable-logging')
-        chrome_options.add_argument('--v=1')
+        # Verbose Chrome logging and a fixed DevTools port only when debugging Chrome itself
+        if self.debug_chrome:
+            chrome_options.add_argument('--remote-debugging-port=9222')
+            chrome_options.add_argument('--enable-logging')
+            chrome_options.add_argument('--v=1')
+        else:
+            # Chrome still prints ERROR-level lines to stderr by default; keep only fatal ones
+            chrome_options.add_argument('--log-level=3')
 
         return chrome_options
 
@@ -310,8 +395,14 @@ class NetworkAnalyzer:
         # Selenium-wire options for network interception with full logging
         seleniumwire_options = {
             'disable_encoding': True,  # Don't decode responses
-            'request_storage_base_dir': '/tmp/seleniumwire',  # Store requests on disk
+            # In-memory storage capped at 1000 requests (oldest evicted first): processing reads the
+            # interceptor stream, not this storage, so nothing needs to survive on disk
+            'request_storage': 'memory',
+            'request_storage_max_size': 1000,
             'enable_har': True,  # Enable HAR capture for detailed request/response logging
+            'connection_keep_alive': True,  # Reuse upstream sockets through the proxy
+            'suppress_connection_errors': True,  # Don't log a traceback for every dropped connection
+            'exclude_hosts': list(PROXY_EXCLUDED_HOSTS),  # Bypass the proxy for ad/analytics noise
         }
 
         if self.verbose:
@@ -325,6 +416,17 @@ class NetworkAnalyzer:
             )
             self.driver.set_page_load_timeout(60)
 
+            # Stream each captured request to the monitoring loop as its response arrives, instead of
+            # reloading selenium-wire's whole storage every poll. Capture is deliberately not scoped: an iframe's
+            # document and first subresources load before the poll that detects it, and are only matched
+            # (in is_mellowtel_request) once its domain is tracked.
+            captured_requests = self._captured_requests
+
+            def capture_response(request, response):
+                captured_requests.put(request)
+
+            self.driver.response_interceptor = capture_response
+
             if self.verbose:
                 def request_interceptor(request):
                     url = request.url
@@ -335,6 +437,7 @@ class NetworkAnalyzer:
                             logger.info(f"[REQUEST BODY][MATCH] {request.body}")
 
                 def response_interceptor(request, response):
+                    capture_response(request, response)
                     url = request.url
                     if _is_interesting_url(url):
                         logger.info(f"[NETWORK RESPONSE][MATCH] {response.status_code} {url}")
@@ -807,7 +910,7 @@ class NetworkAnalyzer:
             # Extract request headers
             request_headers = {}
             if hasattr(request, 'headers'):
-                request_headers = dict(request.headers)
+                request_headers = _canonical_headers(request.headers)
 
             # Extract response data if available
             response_data = {}
@@ -815,11 +918,11 @@ class NetworkAnalyzer:
                 response_data = {
                     'status_code': request.response.status_code,
                     'reason': request.response.reason,
-                    'headers': dict(request.response.headers) if hasattr(request.response, 'headers') else {}
+                    'headers': _canonical_headers(request.response.headers) if hasattr(request.response, 'headers') else {}
                 }
 
             return {
-                'timestamp': int(datetime.utcnow().timestamp()),
+                'timestamp': int(time.time()),
                 'url': request.url,
                 'method': request.method,
                 'request_headers': request_headers,
@@ -882,11 +985,25 @@ class NetworkAnalyzer:
         Returns empty string if URL is invalid.
         """
         try:
-            parsed = urlparse(url)
-            return parsed.netloc.lower()
+            return _netloc(url)
         except Exception:
             return ""
 
+    def _compile_mellowtel_pattern(self):
+        """
+        Compile the tracked iframe domains into a single regex anchored on the URL host.
+        Returns None while no domain is tracked. Must be rebuilt whenever self.mellowtel_domains changes.
+        """
+        if not self.mellowtel_domains:
+            return None
+        # Host (netloc) must equal a tracked iframe domain, same as extract_domain() comparison
+        domains = '|'.join(re.escape(domain) for domain in sorted(self.mellowtel_domains))
+        return re.compile(rf'^[A-Za-z][A-Za-z0-9+.-]*://(?i:{domains})(?:[/?#]|$)')
+
+    def _refresh_mellowtel_filter(self):
+        """Rebuild the domain pattern. Call whenever self.mellowtel_domains changes."""
+        self._mellowtel_pattern = self._compile_mellowtel_pattern()
+
     def is_mellowtel_request(self, request_url: str) -> bool:
         """
         Check if a request is Mellowtel-related.
@@ -894,20 +1011,15 @@ class NetworkAnalyzer:
         - URL contains 'request.mellow.tel'
         - Request domain matches any tracked Mellowtel iframe domain
         """
-        # Check for request.mellow.tel
+        # Plain substring check first; most URLs are rejected without entering the regex engine
         if 'request.mellow.tel' in request_url:
             return True
 
-        # Extract domain from request URL
-        request_domain = self.extract_domain(request_url)
-        if not request_domain:
+        if self._mellowtel_pattern is None:
             return False
 
-        # Check if request domain matches any tracked iframe domains
-        if request_domain in self.mellowtel_domains:
-            return True
-
-        return False
+        # Anchored match: fails as soon as the host differs (no urlparse per request)
+        return self._mellowtel_pattern.match(request_url) is not None
 
     def update_iframe_metadata(self, iframe_data: Dict[str, str], current_time: float):
         """
@@ -941,21 +1053,28 @@ class NetworkAnalyzer:
             iframe_src: Optional specific iframe src to save. If None, saves all iframes.
         """
         try:
-            # Ensure output directory exists
-            Path(self.iframe_metadata_file).parent.mkdir(parents=True, exist_ok=True)
-
             if iframe_src:
                 # Save metadata for a single specific iframe
                 if iframe_src not in self.iframe_metadata:
                     logger.warning(f"Iframe {iframe_src} not found in metadata")
                     return
+                sources = [iframe_src]
+            else:
+                # Save metadata for all remaining iframes
+                if not self.iframe_metadata:
+                    logger.info("No iframe metadata to save")
+                    return
+                sources = list(self.iframe_metadata)
 
-                metadata = self.iframe_metadata[iframe_src]
+            records = []
+            for src in sources:
+                # Remove from memory after saving
+                metadata = self.iframe_metadata.pop(src)
 
                 # Calculate duration
                 duration = metadata['last_seen'] - metadata['first_seen']
 
-                iframe_record = {
+                records.append({
                     'visited_site': site_url,
                     'src': metadata['src'],
                     'id': metadata['id'],
@@ -965,46 +1084,15 @@ class NetworkAnalyzer:
                     'last_seen': metadata['last_seen'],
                     'duration_seconds': duration,
                     'all_attributes': metadata.get('all_attributes', {})
-                }
-
-                # Write as JSON Lines format
-                with open(self.iframe_metadata_file, 'a') as f:
-                    f.write(json.dumps(iframe_record) + '\n')
+                })
 
-                logger.info(f"Saved metadata for iframe: {metadata['domain']}")
+            # Enqueue the records (non-blocking; written as JSON Lines on the writer thread)
+            self.file_writer.enqueue_jsonl(self.iframe_metadata_file, records)
 
-                # Remove from memory after saving
-                del self.iframe_metadata[iframe_src]
+            if iframe_src:
+                logger.info(f"Saved metadata for iframe: {records[0]['domain']}")
             else:
-                # Save metadata for all remaining iframes
-                if not self.iframe_metadata:
-                    logger.info("No iframe metadata to save")
-                    return
-
-                with open(self.iframe_metadata_file, 'a') as f:
-                    for src, metadata in self.iframe_metadata.items():
-                        # Calculate duration
-                        duration = metadata['last_seen'] - metadata['first_seen']
-
-                        iframe_record = {
-                            'visited_site': site_url,
-                            'src': metadata['src'],
-                            'id': metadata['id'],
-                            'data_id': metadata['data_id'],
-                            'domain': metadata['domain'],
-                            'first_seen': metadata['first_seen'],
-                            'last_seen': metadata['last_seen'],
-                            'duration_seconds': duration,
-                            'all_attributes': metadata.get('all_attributes', {})
-                        }
-
-                        # Write as JSON Lines format
-                        f.write(json.dumps(iframe_record) + '\n')
-
-                logger.info(f"Saved metadata for {len(self.iframe_metadata)} remaining iframe(s)")
-
-                # Clear all after saving
-                self.iframe_metadata.clear()
+                logger.info(f"Saved metadata for {len(records)} remaining iframe(s)")
 
         except Exception as e:
             logger.error(f"Failed to save iframe metadata: {e}")
@@ -1027,9 +1115,6 @@ class NetworkAnalyzer:
             if 'text' not in content_type:
                 return
 
-            # Ensure output directory exists
-            Path(self.post_payloads_dir).mkdir(parents=True, exist_ok=True)
-
             # Get request body
             body = None
             if hasattr(request, 'body'):
@@ -1042,9 +1127,10 @@ class NetworkAnalyzer:
             # Increment counter
             self.post_payload_counter += 1
 
-            # Create filename with timestamp, counter, and visited site
+            # Create filename with timestamp, counter, and visited site (one clock read for name and header)
+            now = datetime.now(timezone.utc)
             safe_site = site_url.replace('https://', '').replace('http://', '').replace('/', '_')[:50]
-            timestamp_str = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            timestamp_str = now.strftime('%Y%m%d_%H%M%S_%f')
             filename = f"post_payload_{self.post_payload_counter:04d}_{timestamp_str}_{safe_site}.txt"
             filepath = Path(self.post_payloads_dir) / filename
 
@@ -1062,19 +1148,22 @@ class NetworkAnalyzer:
             else:
                 body_text = str(body)
 
-            # Save to file with metadata header
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"POST Payload Capture\n")
-                f.write(f"=" * 70 + "\n")
-                f.write(f"Timestamp: {datetime.utcnow().isoformat()}\n")
-                f.write(f"Visited Site: {site_url}\n")
-                f.write(f"URL: {request.url}\n")
-                f.write(f"Content-Type: {content_type}\n")
-                f.write(f"Content-Length: {len(body) if body else 0} bytes\n")
-                f.write(f"=" * 70 + "\n\n")
-                f.write(body_text)
+            # Save to file with metadata header (the writer thread creates post_payloads/ and
+            # writes the whole file in one call, so disk latency never stalls request processing)
+            content = (
+                f"POST Payload Capture\n"
+                + "=" * 70 + "\n"
+                + f"Timestamp: {now.replace(tzinfo=None).isoformat()}\n"
+                + f"Visited Site: {site_url}\n"
+                + f"URL: {request.url}\n"
+                + f"Content-Type: {content_type}\n"
+                + f"Content-Length: {len(body) if body else 0} bytes\n"
+                + "=" * 70 + "\n\n"
+                + body_text
+            )
+            self.file_writer.enqueue_write(str(filepath), content.encode('utf-8'), mode='wb')
 
-            logger.info(f"[POST]Saved POST payload to: {filename} ({len(body) if body else 0} bytes)")
+            logger.info(f"[POST]Queued POST payload: {filename} ({len(body) if body else 0} bytes)")
 
         except Exception as e:
             logger.warning(f"Failed to save POST payload: {e}")
@@ -1087,19 +1176,16 @@ class NetworkAnalyzer:
         Stores requests in memory grouped by iframe URL.
         """
         try:
-            total_requests = len(self.driver.requests)
-
-            # Only process new requests since last check
-            if self.last_processed_request_index >= total_requests:
+            # Drain the requests streamed in by the response interceptor since the last check
+            requests = self._drain_captured_requests()
+            if not requests:
                 return  # No new requests
 
             new_request_count = 0
 
             # Process only new requests
-            for i in range(self.last_processed_request_index, total_requests):
+            for request in requests:
                 try:
-                    request = self.driver.requests[i]
-
                     # Check and save POST payloads if applicable
                     self.save_post_payload(request, site_url)
 
@@ -1165,16 +1251,10 @@ class NetworkAnalyzer:
                                         new_request_count += 1
                                         break
 
-                except RuntimeError as e:
-                    if "dictionary changed size during iteration" in str(e):
-                        # Skip this request and continue
-                        logger.warning(f"RuntimeError processing request {i}, skipping")
-                        continue
-                    else:
-                        raise
-
-            # Update the last processed index
-            self.last_processed_request_index = total_requests
+                except Exception as e:
+                    # Confine failures to this request; the rest of the drained batch is not re-queued
+                    logger.warning(f"Error processing request {getattr(request, 'url', '?')}: {e}")
+                    continue
 
             if new_request_count > 0:
                 logger.info(f"Processed {new_request_count} new Mellowtel request(s)")
@@ -1182,6 +1262,16 @@ class NetworkAnalyzer:
         except Exception as e:
             logger.error(f"Failed to process new requests: {e}")
 
+    def _drain_captured_requests(self) -> list:
+        """Return (and remove) every request queued by the response interceptor so far."""
+        requests = []
+        try:
+            while True:
+                requests.append(self._captured_requests.get_nowait())
+        except queue.Empty:
+            pass
+        return requests
+
     def write_iframe_requests(self, iframe_url: str):
         """
         Write all aggregated requests for a specific iframe to the output file.
@@ -1204,11 +1294,11 @@ class NetworkAnalyzer:
                     request_data['iframe_domain'] = iframe_data['domain']
 
                     # Add as JSON Lines format
-                    content_lines.append(json.dumps(request_data) + '\n')
+                    content_lines.append(orjson.dumps(request_data) + b'\n')
 
                 # Enqueue the write (non-blocking)
-                content = ''.join(content_lines)
-                self.file_writer.enqueue_write(self.output_file, content, mode='a')
+                content = b''.join(content_lines)
+                self.file_writer.enqueue_write(self.output_file, content, mode='ab')
 
                 logger.info(f"[WRITE]Queued {request_count} requests for iframe: {iframe_data['domain']}")
 
@@ -1242,11 +1332,11 @@ class NetworkAnalyzer:
                         request_data['iframe_domain'] = iframe_data['domain']
 
                         # Add as JSON Lines format
-                        content_lines.append(json.dumps(request_data) + '\n')
+                        content_lines.append(orjson.dumps(request_data) + b'\n')
 
                     # Enqueue the write (non-blocking)
-                    content = ''.join(content_lines)
-                    self.file_writer.enqueue_write(self.output_file, content, mode='a')
+                    content = b''.join(content_lines)
+                    self.file_writer.enqueue_write(self.output_file, content, mode='ab')
 
                     total_queued += request_count
                     logger.info(f"[WRITE]Queued {request_count} remaining requests for iframe: {iframe_data['domain']}")
@@ -1266,10 +1356,12 @@ class NetworkAnalyzer:
             if len(windows) > 1:
                 logger.info(f"Closing {len(windows) - 1} extra tab(s)...")
 
-                # Keep the first tab, close all others
-                for i in range(len(windows) - 1, 0, -1):
-                    self.driver.switch_to.window(windows[i])
-                    self.driver.close()
+                # Keep the first tab, close all others via CDP (window handles are CDP target IDs),
+                # avoiding a switch_to.window + close round-trip per tab
+                targets = self.driver.execute_cdp_cmd('Target.getTargets', {})['targetInfos']
+                for target in targets:
+                    if target['type'] == 'page' and target['targetId'] != windows[0]:
+                        self.driver.execute_cdp_cmd('Target.closeTarget', {'targetId': target['targetId']})
 
                 # Switch back to the first (remaining) tab
                 self.driver.switch_to.window(windows[0])
@@ -1286,6 +1378,22 @@ class NetworkAnalyzer:
             except:
                 pass
 
+    def wait_for_dom_ready(self, navigation_start_ms: float, timeout: float = 10):
+        """
+        Block until the document navigated to after navigation_start_ms (epoch ms) has been parsed
+        (DOMContentLoaded), at most timeout seconds. With page_load_strategy 'none' driver.get()
+        returns before the new document exists, so monitoring could otherwise start on the old one.
+        """
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.2, ignored_exceptions=(WebDriverException,)).until(
+                lambda driver: driver.execute_script(
+                    "return performance.timeOrigin >= arguments[0] && document.readyState !== 'loading';",
+                    navigation_start_ms - 50
+                )
+            )
+        except TimeoutException:
+            logger.warning(f"Document not ready after {timeout}s, monitoring anyway")
+
     def visit_site(self, url: str):
         """Visit a single site and monitor for the full duration."""
         logger.info(f"\nVisiting: {url}")
@@ -1322,10 +1430,11 @@ class NetworkAnalyzer:
 
                 self.mellowtel_iframe_urls.clear()
                 self.mellowtel_domains.clear()
+                self._refresh_mellowtel_filter()
                 self.iframe_metadata.clear()
                 self.iframe_requests.clear()
                 self.current_visible_iframes.clear()
-                self.last_processed_request_index = 0
+                self._drain_captured_requests()  # Discard late responses from the previous site
 
                 # Navigation with RuntimeError retry logic
                 max_retries = 3
@@ -1333,7 +1442,9 @@ class NetworkAnalyzer:
                 for nav_attempt in range(max_retries):
                     try:
                         # Navigate to the URL
+                        navigation_start_ms = time.time() * 1000
                         self.driver.get(url)
+                        self.wait_for_dom_ready(navigation_start_ms)
                         logger.info(f"Page loaded.")
                         nav_success = True
                         break  # Success, exit retry loop
@@ -1431,12 +1542,18 @@ class NetworkAnalyzer:
                         self.mellowtel_iframe_urls.update(new_iframes)
 
                         # Extract and track domains from new iframe URLs
+                        domains_added = False
                         for iframe_url in new_iframes:
                             domain = self.extract_domain(iframe_url)
-                            if domain:
+                            if domain and domain not in self.mellowtel_domains:
                                 self.mellowtel_domains.add(domain)
+                                domains_added = True
                                 logger.info(f"Tracking new domain: {domain}")
 
+                        # New iframe URLs often reuse a tracked domain; only recompile when the set grew
+                        if domains_added:
+                            self._refresh_mellowtel_filter()
+
                         total_iframes_found = len(self.mellowtel_iframe_urls)
                         logger.info(f"[SUCCESS]New Mellowtel iframe(s) detected! Total tracking: {total_iframes_found} iframe URL(s) and {len(self.mellowtel_domains)} domain(s)")
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Tests for run_experiment.py's hand-written parsers: CRX headers and extension IDs,
+header copying for network_logs.jsonl (http_headers.py), and Mellowtel domain matching.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import struct
+import tempfile
+import zipfile
+from http.client import HTTPMessage
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('seleniumwire')
+import http_headers  # noqa: E402
+import run_experiment  # noqa: E402
+
+# RSA-2048 SubjectPublicKeyInfo; the ID was derived independently with
+# `openssl dgst -sha256 -binary key.der | head -c 16 | xxd -p | tr 0-9a-f a-p`
+RSA_KEY = base64.b64decode(
+    'MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEAwf5j9co6jNyfyrqagj+dW4kgPLK6xvhy2zWKi+VzZ2jc1rnzeO8haJDYSgbG'
+    'hq+S11qmmeZNqrnxgiA2HiRW7BzoFGrwUJpFlK+9HnKAzWPFlx0/zhqoHyTMGpul2tCcJWqbzDpISVXs9+Avm6gd7wTWGmXFgO1iXTJt'
+    'tDQ67lhqGY2p0MQe67vZcv5LxDGszqJWwAiq6ppDwyt/llAk8cP7BvS7uS25aUivsb4KRx66yfkqudesnLrbW5C4/IaDov7RzD7D0BkB'
+    'dL3kZlumTFj1v5DHuCMtz9Mm9yF9omT/2ibSEyu7KsSkwE0U/HcpDbGh1HrH/DE0qjVQyGmjxwIDAQAB'
+)
+EXTENSION_ID = 'gfmffaddkdloegilijjmbeniohnfbkga'
+# P-256 key standing in for the Web Store's own proof, which is not the extension's key
+EC_KEY = base64.b64decode(
+    'MFkwEwYHKoZIzj0CAQYIKoZIzj0DAQcDQgAExih7RTd1K5pKUBXADouTmzGL7YjIS07uPocY/J5PBV2P57SUWkx+7Z0xH05gKtnkkE81'
+    'CQ2rtAcmIf5iXrWk0A=='
+)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """Length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _zip_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps({'name': 'Test', 'version': '1.0', 'manifest_version': 3}))
+    return buffer.getvalue()
+
+
+def _crx3(crx_id: bytes = None, proofs=((2, RSA_KEY), (3, EC_KEY)), signed_data: bool = True) -> bytes:
+    """CRX3 laid out like a Web Store download: key proofs, then the signed header data."""
+    if crx_id is None:
+        crx_id = bytes.fromhex(EXTENSION_ID.translate(str.maketrans('abcdefghijklmnop', '0123456789abcdef')))
+    header = b''.join(_field(number, _field(1, key) + _field(2, b'\x00' * 64)) for number, key in proofs)
+    if signed_data:
+        header += _field(10000, _field(1, crx_id))
+    return b'Cr24' + struct.pack('<II', 3, len(header)) + header + _zip_archive()
+
+
+def _crx2() -> bytes:
+    signature = b'\x00' * 256
+    return b'Cr24' + struct.pack('<III', 2, len(RSA_KEY), len(signature)) + RSA_KEY + signature + _zip_archive()
+
+
+def test_crx3_extension_id():
+    assert run_experiment._crx_extension_id(_crx3()) == EXTENSION_ID
+
+
+def test_crx2_extension_id():
+    assert run_experiment._crx_extension_id(_crx2()) == EXTENSION_ID
+
+
+def test_crx3_picks_the_key_matching_the_id():
+    crx = _crx3()
+    _, public_key, zip_offset = run_experiment._parse_crx(crx)
+    assert public_key == RSA_KEY
+    assert crx[zip_offset:zip_offset + 4] == b'PK\x03\x04'
+
+
+@pytest.mark.parametrize('crx', [
+    b'',
+    b'PK\x03\x04',
+    b'Cr24',
+    b'Cr24' + struct.pack('<I', 3),
+    b'Cr24' + struct.pack('<I', 4) + b'\x00' * 16,
+    _crx3()[:20],  # Header size points past the end of the data
+    b'Cr24' + struct.pack('<II', 3, 1) + b'\x0d',  # Unsupported wire type
+    b'Cr24' + struct.pack('<II', 3, 2) + b'\x0a\x7f',  # Length runs past the header
+    b'Cr24' + struct.pack('<II', 3, 1) + b'\x80',  # Truncated varint
+], ids=['empty', 'zip', 'magic-only', 'no-header-size', 'crx4', 'truncated', 'wire-type', 'overlong', 'varint'])
+def test_malformed_crx_returns_none(crx):
+    assert run_experiment._parse_crx(crx) is None
+    assert run_experiment._crx_extension_id(crx) is None
+
+
+def test_crx3_without_signed_header_data_returns_none():
+    assert run_experiment._parse_crx(_crx3(signed_data=False)) is None
+
+
+def test_crx3_with_short_crx_id_returns_none():
+    assert run_experiment._crx_extension_id(_crx3(crx_id=b'\x01\x02\x03\x04')) is None
+
+
+def test_unpack_crx_adds_manifest_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    crx = _crx3()
+
+    unpacked = run_experiment._unpack_crx(crx, 'Test.crx')
+
+    assert Path(unpacked).parent == tmp_path / 'mellowtel_extensions'
+    manifest = json.loads((Path(unpacked) / 'manifest.json').read_text())
+    assert manifest['key'] == base64.b64encode(RSA_KEY).decode('ascii')
+    assert manifest['name'] == 'Test'
+    # Content-addressed: a second call reuses the extracted copy
+    assert run_experiment._unpack_crx(crx, 'Test.crx') == unpacked
+    assert Path(unpacked).name == f'Test_{hashlib.sha256(crx).hexdigest()[:16]}'
+
+
+def test_unpack_crx_without_extension_key_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    assert run_experiment._unpack_crx(_crx3(proofs=((3, EC_KEY),)), 'Test.crx') is None
+
+
+def _headers(*pairs) -> HTTPMessage:
+    # selenium-wire's HTTPHeaders is an HTTPMessage subclass
+    headers = HTTPMessage()
+    for name, value in pairs:
+        headers[name] = value
+    return headers
+
+
+def test_encode_headers_keeps_first_value_of_repeated_name():
+    headers = _headers(('Set-Cookie', 'a=1'), ('Content-Type', 'text/html'), ('Set-Cookie', 'b=2'))
+    encoded = run_experiment._encode_headers(headers)
+    assert encoded == {'Set-Cookie': 'a=1', 'Content-Type': 'text/html'}
+    assert encoded == dict(headers)
+
+
+def test_encode_headers_drops_configured_headers(monkeypatch):
+    monkeypatch.setattr(http_headers, 'DROPPED_HEADERS', frozenset({'cookie', 'user-agent'}))
+    headers = _headers(('Cookie', 'session=1'), ('User-Agent', 'Chrome'), ('Referer', 'https://example.com/'))
+    assert run_experiment._encode_headers(headers) == {'Referer': 'https://example.com/'}
+
+
+def test_interned_copy_matches_plain_copy(monkeypatch):
+    # The sibling runners copy headers with intern=True; the result must not differ
+    monkeypatch.setattr(http_headers, 'DROPPED_HEADERS', frozenset({'cookie'}))
+    headers = _headers(('Cookie', 'session=1'), ('Content-Type', 'text/html'), ('Set-Cookie', 'a=1'),
+                       ('Set-Cookie', 'b=2'))
+    copied = http_headers.copy_headers(headers, intern=True)
+    assert copied == http_headers.copy_headers(headers) == {'Content-Type': 'text/html', 'Set-Cookie': 'a=1'}
+    again = http_headers.copy_headers(_headers(('Content-Type', 'text/html')), intern=True)
+    assert copied['Content-Type'] is again['Content-Type']
+
+
+def test_encode_headers_rejects_other_types():
+    with pytest.raises(TypeError):
+        run_experiment._encode_headers(object())
+
+
+@pytest.fixture
+def analyzer():
+    analyzer = run_experiment.NetworkAnalyzer(extension_name='IdleForest.crx', timestamp='test')
+    analyzer.mellowtel_domains.add('example.com')
+    analyzer._refresh_mellowtel_filter()
+    yield analyzer
+    analyzer.file_writer.shutdown()
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com/',
+    'https://example.com',
+    'https://EXAMPLE.com/frame.html',
+    'https://example.com?x=1',
+    'https://example.com#top',
+    'https://request.mellow.tel/collect',
+])
+def test_is_mellowtel_request_matches_tracked_hosts(analyzer, url):
+    assert analyzer.is_mellowtel_request(url)
+
+
+@pytest.mark.parametrize('url', [
+    'https://evil-example.com/',
+    'https://example.com.attacker.net/',
+    'https://sub.example.com/',
+    'https://example.com:8443/',
+    'https://attacker.net/?next=https://example.com/',
+    'https://example.company/',
+])
+def test_is_mellowtel_request_is_anchored_on_the_host(analyzer, url):
+    assert not analyzer.is_mellowtel_request(url)
+
+
+def test_is_mellowtel_request_follows_domain_changes(analyzer):
+    assert not analyzer.is_mellowtel_request('https://other.net/')
+    analyzer.mellowtel_domains.add('other.net')
+    analyzer._refresh_mellowtel_filter()
+    assert analyzer.is_mellowtel_request('https://other.net/')